@@ -1,23 +1,152 @@
+import time
+start_time = time.perf_counter()
+
 import pygame
+import numpy as np
 import random
 import json
+import bisect
 import sys
 import os
-
-from decimal import Decimal, getcontext
+import threading
+import queue
+import copy
+import atexit
+import struct
+import zlib
+import mmap
+import multiprocessing
+import hashlib
+import csv
+import math
+import shutil
+
+from collections import OrderedDict, namedtuple
+from collections.abc import MutableMapping
 
 is_resized = False
 
-getcontext().prec = 50  # Set precision for Decimal operations
-pygame.init()
+# Created by bootstrap(), so importing the module never opens a window or touches the disk
+screen = None
+clock = None
+
+class StartupTimer:
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.stages = []
+        self.finished = False
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+
+    def finish(self, stage):
+        # Called once the first menu frame is on screen
+        if self.finished:
+            return
+        self.mark(stage)
+        self.finished = True
+        if "--startup-report" in sys.argv:
+            print(self.report())
+
+    def report(self):
+        lines = [f"{stage:<24}{seconds * 1000:8.1f} ms" for stage, seconds in self.stages]
+        lines.append(f"{'total':<24}{(self.last - self.start) * 1000:8.1f} ms")
+        return "\n".join(lines)
 
-screen = pygame.display.set_mode((800, 600), pygame.RESIZABLE)
-title_font = pygame.font.SysFont("Monospace", 150, bold=True, italic=True)
-clock = pygame.time.Clock()
+startup = StartupTimer(start_time)
 
-# Ensure the 'saves' directory exists
-if not os.path.exists("saves"):
-    os.makedirs("saves")
+class FontRegistry:
+    def __init__(self):
+        self.fonts = {}
+        self.lock = threading.Lock()
+
+    def get(self, family="Monospace", size=24, bold=False, italic=False):
+        key = (family, int(size), bool(bold), bool(italic))
+        font = self.fonts.get(key)
+        if font is None:
+            with self.lock:
+                font = self.fonts.get(key)
+                if font is None:
+                    font = pygame.font.SysFont(family, int(size), bold=bold, italic=italic)
+                    self.fonts[key] = font
+        return font
+
+    def preload(self, specs):
+        # specs are (family, size, bold, italic) tuples, resolved off the main thread
+        def worker():
+            for spec in specs:
+                self.get(*spec)
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        return thread
+
+fonts = FontRegistry()
+
+class TextCache:
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.entries = OrderedDict()
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        # The Font object stands in for the family, size and style are read from it
+        key = (font, font.get_height(), font.get_bold(), font.get_italic(), text, tuple(color), antialias)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        size = surface.get_pitch() * surface.get_height()
+        if size > self.max_bytes:
+            return surface
+        self.entries[key] = surface
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= old.get_pitch() * old.get_height()
+        return surface
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+text_cache = TextCache()
+
+class LiveText:
+    # Readouts that change nearly every frame stay out of the shared cache and re-render a few times per second at most
+    def __init__(self, font, color=(0, 0, 0), rate=4.0):
+        self.font = font
+        self.color = color
+        self.interval = 1 / rate
+        self.text = None
+        self.surface = None
+        self.next_update = 0.0
+
+    def render(self, text):
+        now = time.perf_counter()
+        if self.surface is None or (text != self.text and now >= self.next_update):
+            self.surface = self.font.render(text, True, self.color)
+            self.text = text
+            self.next_update = now + self.interval
+        return self.surface
+
+TITLE_FONT = ("Monospace", 150, True, True)
+PRELOAD_FONTS = [
+    TITLE_FONT,
+    ("Monospace", 24, False, False),
+    ("Monospace", 24, True, False),
+    ("Monospace", 48, False, False),
+    ("Monospace", 40, False, False),
+    ("Monospace", 33, False, False),
+]
 
 class DocumentObject:
     def __init__(self, type, content, font="Monospace", font_size=24):
@@ -31,78 +160,101 @@ class DocumentObject:
         elif type == "h3":
             fs *= 1.4
         self.font_size = int(fs)
-        self.font = pygame.font.SysFont(font, int(fs))
-        self.bold_font = pygame.font.SysFont(font, int(fs), bold=True)
+        self.font = fonts.get(font, int(fs))
+        self.bold_font = fonts.get(font, int(fs), bold=True)
 
-    def draw(self, surface, y, last_object_rect):
-        if self.type == "text":
-            text_surface = self.font.render(self.content, True, (50, 50, 50))
-            text_rect = text_surface.get_rect(topleft=(10, y))
-            surface.blit(text_surface, text_rect.topleft)
-            return text_rect
+    def layout(self, width, y, last_object_rect):
+        # Returns this object's rect in document space, measured without rendering anything
+        if self.type in ["text", "h1", "h2", "h3"]:
+            return pygame.Rect((10, y), self.font.size(self.content))
         elif self.type == "bold":
-            text_surface = self.bold_font.render(self.content, True, (50, 50, 50))
+            size = self.bold_font.size(self.content)
             if last_object_rect:
-                text_rect = text_surface.get_rect(topleft=(last_object_rect.right + 10, last_object_rect.top))
-            else:
-                text_rect = text_surface.get_rect(topleft=(10, y))
-            surface.blit(text_surface, text_rect.topleft)
-            return text_rect
+                return pygame.Rect((last_object_rect.right + 10, last_object_rect.top), size)
+            return pygame.Rect((10, y), size)
         elif self.type == "listobj":
-            text_surface = self.font.render(self.content, True, (50, 50, 50))
-            surf = pygame.Surface((text_surface.get_width() + 20, text_surface.get_height()), pygame.SRCALPHA)
-            pygame.draw.circle(surf, (50, 50, 50), (10, text_surface.get_height() // 2), 5)
-            surf.blit(text_surface, (20, 0))
-            text_rect = surf.get_rect(topleft=(10, y))
-            surface.blit(surf, text_rect.topleft)
-            return text_rect
+            text_width, text_height = self.font.size(self.content)
+            return pygame.Rect(10, y, text_width + 20, text_height)
         elif self.type == "split":
-            text_surface = self.font.render(self.content, True, (50, 50, 50))
-            text_rect = text_surface.get_rect(center=(surface.get_width() // 2, y + text_surface.get_height() // 2))
-            line_width = (surface.get_width() - text_rect.width) // 2 - 20
-            line = pygame.Surface((line_width, 2))
-            surf = pygame.Surface((surface.get_width(), text_rect.height), pygame.SRCALPHA)
-            surf.blit(line, (10, text_rect.centery - 1 - y))
-            surf.blit(text_surface, (text_rect.x, 0))
-            surf.blit(line, (text_rect.x + text_rect.width + 10, text_rect.centery - 1 - y))
-            surface.blit(surf, (0, y))
-            return pygame.Rect(0, y, surface.get_width(), text_surface.get_height())
-        elif self.type in ["h1", "h2", "h3"]:
-            text_surface = self.font.render(self.content, True, (50, 50, 50))
-            text_rect = text_surface.get_rect(topleft=(10, y))
-            surface.blit(text_surface, text_rect.topleft)
-            return text_rect
+            return pygame.Rect(0, y, width, self.font.size(self.content)[1])
         elif self.type == "newline":
-            return pygame.Rect(0, y, surface.get_width(), self.font.get_height() + 5)
+            return pygame.Rect(0, y, width, self.font.get_height() + 5)
         else:
             raise ValueError(f"Unknown DocumentObject type: {self.type}")
 
+    def render(self, surface, rect):
+        # Only called for visible objects, the text itself comes from the shared text cache
+        if self.type in ["text", "h1", "h2", "h3"]:
+            surface.blit(text_cache.render(self.font, self.content, (50, 50, 50)), rect.topleft)
+        elif self.type == "bold":
+            surface.blit(text_cache.render(self.bold_font, self.content, (50, 50, 50)), rect.topleft)
+        elif self.type == "listobj":
+            pygame.draw.circle(surface, (50, 50, 50), (rect.x + 10, rect.y + rect.height // 2), 5)
+            surface.blit(text_cache.render(self.font, self.content, (50, 50, 50)), (rect.x + 20, rect.y))
+        elif self.type == "split":
+            text_surface = text_cache.render(self.font, self.content, (50, 50, 50))
+            text_rect = text_surface.get_rect(center=rect.center)
+            line_width = max((rect.width - text_rect.width) // 2 - 20, 0)
+            surface.fill((0, 0, 0), (rect.x + 10, text_rect.centery - 1, line_width, 2))
+            surface.blit(text_surface, text_rect.topleft)
+            surface.fill((0, 0, 0), (text_rect.right + 10, text_rect.centery - 1, line_width, 2))
+
+    def draw(self, surface, y, last_object_rect):
+        rect = self.layout(surface.get_width(), y, last_object_rect)
+        self.render(surface, rect)
+        return rect
+
 class Document:
     def __init__(self):
         self.objects = []
         self.font = "Monospace"
+        self.width = None
+        self.height = 0
+        self.rects = []
+        self.bottoms = []
 
     def add(self, obj):
         if isinstance(obj, DocumentObject):
             self.objects.append(obj)
+            self.width = None
         else:
             raise TypeError("Object must be an instance of DocumentObject")
         
     def init(self):
         pass
 
+    def layout(self, width):
+        self.rects = []
+        self.bottoms = []
+        y = 0
+        bottom = 0
+        last_object_rect = None
+        for obj in self.objects:
+            rect = obj.layout(width, y, last_object_rect)
+            self.rects.append(rect)
+            # Running max keeps the bottoms sorted so the viewport can be found with bisect
+            bottom = max(bottom, rect.bottom)
+            self.bottoms.append(bottom)
+            y = rect.bottom + 5  # 5 pixels spacing
+            last_object_rect = rect
+        self.width = width
+        self.height = bottom
+
     def draw(self, surface, offset_y=0):
         if not self.objects:
             return
 
-        y = offset_y
-        last_object_rect = None
-        for obj in self.objects:
-            rect = obj.draw(surface, y, last_object_rect)
-            if rect:
-                y = rect.bottom + 5  # 5 pixels spacing
-                last_object_rect = rect
-        return last_object_rect
+        if surface.get_width() != self.width:
+            self.layout(surface.get_width())
+
+        clip = surface.get_clip()
+        top = clip.top - offset_y
+        bottom = clip.bottom - offset_y
+        i = bisect.bisect_right(self.bottoms, top)
+        while i < len(self.rects) and self.rects[i].top < bottom:
+            self.objects[i].render(surface, self.rects[i].move(0, offset_y))
+            i += 1
+        return self.rects[-1].move(0, offset_y)
 
 class InputBox:
     def __init__(self, pos, size, color=(100, 100, 100), hover_color=(150, 150, 150), text_color=(255, 255, 255), font_family="Monospace", font_size=24, characters="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-, "):
@@ -110,7 +262,7 @@ class InputBox:
         self.color = color
         self.hover_color = hover_color
         self.text_color = text_color
-        self.font = pygame.font.SysFont(font_family, font_size)
+        self.font = fonts.get(font_family, font_size)
         self.font_size = font_size
         self.characters = characters
         self.text = ""
@@ -120,16 +272,11 @@ class InputBox:
         self.active = False
         self.clicked = False
         self.has_backspaced = False
+        self.hovered = False
+        self.drawn_state = None
 
-    def draw(self, surface, dt=1/60000):
-        mouse_pos = pygame.mouse.get_pos()
-        if self.rect.collidepoint(mouse_pos):
-            pygame.draw.rect(surface, self.hover_color, self.rect)
-        else:
-            pygame.draw.rect(surface, self.color, self.rect)
-        pygame.draw.rect(surface, (0, 0, 0), self.rect, 2)  # Draw border
-
-        # Update cursor timer for flicker (1 Hz, toggle every 0.5s)
+    def update(self, dt):
+        # Update cursor timer for flicker (toggle every 0.25s)
         if self.active:
             self.cursor_timer += dt
             if self.cursor_timer >= 0.25:
@@ -139,27 +286,54 @@ class InputBox:
             self.show_cursor = False
             self.cursor_timer = 0
 
+    def next_blink(self):
+        # Seconds until the cursor toggles, None when nothing is animating
+        if self.active:
+            return max(0.25 - self.cursor_timer, 0)
+        return None
+
+    def get_display_text(self):
         # Draw text with cursor if active and show_cursor is True
         if self.active and self.show_cursor:
-            display_text = self.text[:self.column] + "|" + self.text[self.column:]
+            return self.text[:self.column] + "|" + self.text[self.column:]
+        return self.text
+
+    def set_rect(self, rect):
+        self.rect = pygame.Rect(rect)
+
+    def get_state(self):
+        return (self.get_display_text(), self.hovered, tuple(self.rect))
+
+    def needs_redraw(self):
+        return self.get_state() != self.drawn_state
+
+    def draw(self, surface, dt=0):
+        if dt:
+            self.update(dt)
+        state = self.get_state()
+        display_text, hovered, _ = state
+        if hovered:
+            pygame.draw.rect(surface, self.hover_color, self.rect)
         else:
-            display_text = self.text
+            pygame.draw.rect(surface, self.color, self.rect)
+        pygame.draw.rect(surface, (0, 0, 0), self.rect, 2)  # Draw border
 
-        text_surface = self.font.render(display_text, True, self.text_color)
+        text_surface = text_cache.render(self.font, display_text, self.text_color)
         text_rect = text_surface.get_rect(topleft=(self.rect.x + 5, self.rect.y + 5))
         surface.blit(text_surface, text_rect.topleft)
+        self.drawn_state = state
+
+    def hover(self, pos):
+        self.hovered = pos is not None
+
+    def set_active(self, active):
+        self.active = active
+        self.clicked = active
+        if active:
+            # Set cursor position based on mouse click (optional: always at end)
+            self.column = len(self.text)
 
     def handle_event(self, event):
-        if event.type == pygame.MOUSEBUTTONUP:
-            if event.button == 1:    
-                if self.rect.collidepoint(event.pos):
-                    self.active = True
-                    self.clicked = True
-                    # Set cursor position based on mouse click (optional: always at end)
-                    self.column = len(self.text)
-                else:
-                    self.active = False
-                    self.clicked = False
         if event.type == pygame.KEYDOWN and self.active:
             if event.key == pygame.K_BACKSPACE:
                 if self.column > 0:
@@ -196,51 +370,2883 @@ class Button:
         self.hover_color = hover_color
         self.text_color = text_color
         self.rect = pygame.Rect(pos, size)
-        self.font = pygame.font.SysFont(font_family, 24)
-        self.clicked = False
+        self.font = fonts.get(font_family, 24)
+        self.hovered = False
+        self.drawn_state = None
+
+    def set_rect(self, rect):
+        self.rect = pygame.Rect(rect)
+        self.pos = self.rect.topleft
+        self.size = self.rect.size
+
+    def hover(self, pos):
+        self.hovered = pos is not None
+
+    def get_state(self):
+        return (self.text, self.hovered, tuple(self.rect))
+
+    def needs_redraw(self):
+        return self.get_state() != self.drawn_state
 
     def draw(self, surface):
-        mouse_pos = pygame.mouse.get_pos()
-        if self.rect.collidepoint(mouse_pos):
+        state = self.get_state()
+        if state[1]:
             pygame.draw.rect(surface, self.hover_color, self.rect)
         else:
             pygame.draw.rect(surface, self.color, self.rect)
         pygame.draw.rect(surface, (0, 0, 0), self.rect, 2)  # Draw border
 
-        text_surface = self.font.render(self.text, True, self.text_color)
+        text_surface = text_cache.render(self.font, self.text, self.text_color)
         text_rect = text_surface.get_rect(center=self.rect.center)
         surface.blit(text_surface, text_rect.topleft)
+        self.drawn_state = state
+
+class Label:
+    def __init__(self, text_surface):
+        self.surface = text_surface
+        self.rect = text_surface.get_rect()
+        self.drawn_rect = None
+
+    def set_rect(self, rect):
+        self.rect = pygame.Rect(rect)
+
+    def needs_redraw(self):
+        return self.rect != self.drawn_rect
+
+    def draw(self, surface):
+        surface.blit(self.surface, self.rect.topleft)
+        self.drawn_rect = self.rect.copy()
+
+class UINode:
+    def __init__(self, widget=None, size=None, anchor=(0, 0), pivot=None, offset=(0, 0), stretch=(0, 0), direction=None, spacing=0):
+        self.widget = widget
+        if size is None:
+            size = widget.rect.size if widget is not None else (0, 0)
+        self.size = size
+        self.anchor = anchor  # point on the parent rect, as a fraction of its size
+        self.pivot = anchor if pivot is None else pivot  # point on this node placed at the anchor
+        self.offset = offset
+        self.stretch = stretch  # fraction of the parent size added to size
+        self.direction = direction  # "column" or "row" stacks children, None anchors them to this node
+        self.spacing = spacing
+        self.children = []
+        self.parent = None
+        self.rect = pygame.Rect(0, 0, 0, 0)
+        self.parent_rect = None
+        self.dirty = True
+
+    def add(self, child):
+        child.parent = self
+        self.children.append(child)
+        self.mark_dirty()
+        return child
+
+    def mark_dirty(self):
+        node = self
+        while node is not None:
+            node.dirty = True
+            node = node.parent
+
+    def get_size(self, parent_size=(0, 0)):
+        if self.direction is not None and self.children:
+            sizes = [child.get_size(parent_size) for child in self.children]
+            gaps = self.spacing * (len(sizes) - 1)
+            if self.direction == "column":
+                return max(w for w, h in sizes), sum(h for w, h in sizes) + gaps
+            return sum(w for w, h in sizes) + gaps, max(h for w, h in sizes)
+        return (int(self.size[0] + parent_size[0] * self.stretch[0]), int(self.size[1] + parent_size[1] * self.stretch[1]))
+
+    def layout(self, parent_rect):
+        # Skips the whole subtree when neither the parent rect nor anything below changed
+        parent_rect = pygame.Rect(parent_rect)
+        if not self.dirty and parent_rect == self.parent_rect:
+            return
+        self.parent_rect = parent_rect
+        w, h = self.get_size(parent_rect.size)
+        x = parent_rect.x + parent_rect.w * self.anchor[0] - w * self.pivot[0] + self.offset[0]
+        y = parent_rect.y + parent_rect.h * self.anchor[1] - h * self.pivot[1] + self.offset[1]
+        rect = pygame.Rect(int(x), int(y), w, h)
+        if rect != self.rect or self.dirty:
+            self.rect = rect
+            if self.widget is not None:
+                self.widget.set_rect(rect)
+        self.dirty = False
+
+        position = 0
+        for child in self.children:
+            if self.direction == "column":
+                child_h = child.get_size(rect.size)[1]
+                child.layout((rect.x, rect.y + position, rect.w, child_h))
+                position += child_h + self.spacing
+            elif self.direction == "row":
+                child_w = child.get_size(rect.size)[0]
+                child.layout((rect.x + position, rect.y, child_w, rect.h))
+                position += child_w + self.spacing
+            else:
+                child.layout(rect)
+
+    def widgets(self):
+        if self.widget is not None:
+            yield self.widget
+        for child in self.children:
+            yield from child.widgets()
+
+SAVE_MAGIC = b"TLAB"
+SAVE_VERSION = 1
+SAVE_HEADER = struct.Struct("<4sHHIQ")  # magic, version, flags, section count, table of contents offset
+SAVE_TOC_ENTRY = struct.Struct("<HQQQI")  # name length, offset, compressed size, raw size, crc32
+
+# A section that is still compressed, copied straight through when the save is written again
+RawSection = namedtuple("RawSection", ["data", "raw_size", "crc"])
+
+def encode_section(value):
+    # SaveWriter.save can hand a section over as a function that builds it, so the writer thread pays for that
+    if callable(value):
+        value = value()
+    raw = json.dumps(value).encode("utf-8")
+    return RawSection(zlib.compress(raw, 6), len(raw), zlib.crc32(raw))
+
+def decode_section(section):
+    raw = zlib.decompress(section.data)
+    if len(raw) != section.raw_size or zlib.crc32(raw) != section.crc:
+        raise ValueError("Save section is corrupted")
+    return json.loads(raw.decode("utf-8"))
+
+def write_save_file(file, sections):
+    # Header is patched in once the table of contents offset is known
+    file.write(SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION, 0, 0, 0))
+    toc = []
+    for name, value in sections.items():
+        section = value if isinstance(value, RawSection) else encode_section(value)
+        toc.append((name.encode("utf-8"), file.tell(), section))
+        file.write(section.data)
+    toc_offset = file.tell()
+    for name, offset, section in toc:
+        file.write(SAVE_TOC_ENTRY.pack(len(name), offset, len(section.data), section.raw_size, section.crc))
+        file.write(name)
+    file.seek(0)
+    file.write(SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION, 0, len(toc), toc_offset))
+    file.seek(0, os.SEEK_END)
+
+class SaveData(MutableMapping):
+    def __init__(self, sections=None):
+        self.loaded = dict(sections or {})
+        self.raw = {}  # name -> (offset, compressed size, raw size, crc) into self.buffer
+        self.buffer = None
+        self.file = None
+        self.legacy = False
+
+    @classmethod
+    def open(cls, path):
+        data = cls()
+        data.file = open(path, 'rb')
+        try:
+            try:
+                data.buffer = mmap.mmap(data.file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                data.buffer = data.file.read()
+            if data.buffer[:len(SAVE_MAGIC)] != SAVE_MAGIC:
+                data.read_legacy()
+            else:
+                data.read_toc()
+        except (ValueError, struct.error, UnicodeDecodeError):
+            data.close()
+            raise ValueError(f"{path} is not a valid save file")
+        return data
+
+    def read_legacy(self):
+        # Saves written before the chunked format are a single JSON document
+        self.loaded = json.loads(bytes(self.buffer).decode("utf-8"))
+        if not isinstance(self.loaded, dict):
+            raise ValueError("Legacy save is not a JSON object")
+        self.legacy = True
+        self.close()
+
+    def read_toc(self):
+        magic, version, flags, count, toc_offset = SAVE_HEADER.unpack_from(self.buffer, 0)
+        if version > SAVE_VERSION:
+            raise ValueError(f"Save version {version} is newer than this game supports")
+        position = toc_offset
+        for _ in range(count):
+            name_length, offset, size, raw_size, crc = SAVE_TOC_ENTRY.unpack_from(self.buffer, position)
+            position += SAVE_TOC_ENTRY.size
+            name = bytes(self.buffer[position:position + name_length]).decode("utf-8")
+            position += name_length
+            if offset + size > len(self.buffer):
+                raise ValueError("Save section runs past the end of the file")
+            self.raw[name] = (offset, size, raw_size, crc)
+
+    def raw_section(self, name):
+        entry = self.raw[name]
+        if isinstance(entry, RawSection):
+            return entry
+        offset, size, raw_size, crc = entry
+        return RawSection(bytes(self.buffer[offset:offset + size]), raw_size, crc)
+
+    def __getitem__(self, name):
+        if name in self.loaded:
+            return self.loaded[name]
+        if name not in self.raw:
+            raise KeyError(name)
+        try:
+            value = decode_section(self.raw_section(name))
+        except zlib.error:
+            raise ValueError(f"Save section {name} is corrupted")
+        self.loaded[name] = value
+        del self.raw[name]
+        return value
+
+    def __setitem__(self, name, value):
+        self.raw.pop(name, None)
+        self.loaded[name] = value
+
+    def __delitem__(self, name):
+        if name in self.loaded:
+            del self.loaded[name]
+        else:
+            del self.raw[name]
+
+    def __iter__(self):
+        yield from self.loaded
+        yield from self.raw
+
+    def __len__(self):
+        return len(self.loaded) + len(self.raw)
+
+    def __repr__(self):
+        return f"SaveData(loaded={list(self.loaded)}, unloaded={list(self.raw)})"
+
+    def detach(self):
+        # Pulls unloaded sections into memory so the file can be replaced underneath us
+        for name in list(self.raw):
+            self.raw[name] = self.raw_section(name)
+        self.close()
+
+    def snapshot(self, exclude=()):
+        # Sections in exclude are left out, the caller supplies them some other way
+        self.detach()
+        sections = {name: copy.deepcopy(value) for name, value in self.loaded.items() if name not in exclude}
+        sections.update((name, value) for name, value in self.raw.items() if name not in exclude)
+        return sections
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.buffer = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SaveIndex:
+    def __init__(self, directory="saves", index_name="saves.json"):
+        self.directory = directory
+        # Kept in a subdirectory so rewriting the index doesn't touch the saves directory mtime
+        self.index_path = os.path.join(directory, ".index", index_name)
+        self.entries = {}
+        self.dir_mtime = None
+        self.names = []
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as file:
+                    data = json.load(file)
+                self.entries = data.get("entries", {})
+                self.dir_mtime = data.get("dir_mtime")
+            except (OSError, ValueError):
+                self.entries = {}
+            # Indexes written before saves were checked have no validity flag, rescan them once
+            if any("valid" not in entry for entry in self.entries.values()):
+                self.dir_mtime = None
+        self.names = sorted(self.entries)
+
+    def read_seed(self, path):
+        # Only the seed section gets decompressed, the rest of the save is never touched. Unreadable saves are invalid
+        try:
+            with SaveData.open(path) as data:
+                return data.get("seed"), True
+        except (OSError, ValueError):
+            return None, False
+
+    def update(self, file_name, write=True, force=False):
+        path = os.path.join(self.directory, file_name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            if self.entries.pop(file_name, None) is not None:
+                self.names = sorted(self.entries)
+                if write:
+                    self.write()
+            return
+        entry = self.entries.get(file_name)
+        if force or entry is None or "valid" not in entry or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+            seed, valid = self.read_seed(path)
+            self.entries[file_name] = {
+                "name": file_name[:-5],
+                "seed": seed,
+                "valid": valid,
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+            }
+            self.names = sorted(self.entries)
+            if write:
+                self.write()
+
+    def refresh(self):
+        # The directory mtime only changes when saves are added, removed or renamed
+        dir_mtime = os.stat(self.directory).st_mtime
+        if dir_mtime == self.dir_mtime:
+            return False
+        if not os.path.exists(os.path.dirname(self.index_path)):
+            self.write()
+            dir_mtime = os.stat(self.directory).st_mtime
+        seen = set()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".tlab") and entry.is_file():
+                    seen.add(entry.name)
+                    self.update(entry.name, write=False)
+        for name in list(self.entries):
+            if name not in seen:
+                del self.entries[name]
+        self.names = sorted(self.entries)
+        self.dir_mtime = dir_mtime
+        self.write()
+        return True
+
+    def write(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({"dir_mtime": self.dir_mtime, "entries": self.entries}, file)
+        os.replace(tmp_path, self.index_path)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        return self.entries[self.names[i]]
+
+save_index = None
+
+class SaveList:
+    def __init__(self, index, rect, row_height=40, button_size=(200, 30)):
+        self.index = index
+        self.rect = pygame.Rect(rect)
+        self.row_height = row_height
+        self.button_size = button_size
+        self.scroll = 0
+        self.rows = []
+        self.hover_pos = None
+        self.selected = None
+        self.drawn_state = None
+
+    def get_state(self):
+        return (self.scroll, self.row_at(self.hover_pos), len(self.index), tuple(self.rect))
+
+    def needs_redraw(self):
+        return self.get_state() != self.drawn_state
+
+    def set_rect(self, rect):
+        self.rect = pygame.Rect(rect)
+        self.clamp_scroll()
+
+    def clamp_scroll(self):
+        max_scroll = max(0, len(self.index) * self.row_height - self.rect.height)
+        self.scroll = max(0, min(self.scroll, max_scroll))
+
+    def visible_range(self):
+        first = self.scroll // self.row_height
+        last = min(len(self.index), (self.scroll + self.rect.height) // self.row_height + 1)
+        return first, last
+
+    def row_rect(self, i):
+        return pygame.Rect((self.rect.centerx - self.button_size[0] // 2, self.rect.y + i * self.row_height - self.scroll), self.button_size)
+
+    def row_at(self, pos):
+        if pos is None or not self.rect.collidepoint(pos):
+            return None
+        i = (pos[1] - self.rect.y + self.scroll) // self.row_height
+        if 0 <= i < len(self.index) and self.row_rect(i).collidepoint(pos):
+            return i
+        return None
+
+    def hover(self, pos):
+        self.hover_pos = pos
+
+    def on_scroll(self, event):
+        self.scroll -= event.y * self.row_height
+        self.clamp_scroll()
+
+    def on_click(self, pos):
+        # Unreadable saves are listed greyed out and can't be picked
+        i = self.row_at(pos)
+        if i is not None and self.index[i]["valid"]:
+            self.selected = self.index.names[i]
+
+    def draw(self, surface):
+        state = self.get_state()
+        first, last = self.visible_range()
+        # Row buttons are pooled and relabelled as the list scrolls
+        while len(self.rows) < last - first:
+            self.rows.append(Button("", (0, 0), self.button_size))
+        old_clip = surface.get_clip()
+        surface.set_clip(self.rect.clip(old_clip))
+        for button, i in zip(self.rows, range(first, last)):
+            entry = self.index[i]
+            button.text = entry["name"] if entry["valid"] else f"{entry['name']} (unreadable)"
+            button.color, button.text_color = ((100, 100, 100), (255, 255, 255)) if entry["valid"] else ((170, 170, 170), (120, 120, 120))
+            button.rect = self.row_rect(i)
+            button.hovered = i == state[1] and entry["valid"]
+            button.draw(surface)
+        surface.set_clip(old_clip)
+        self.drawn_state = state
+
+class EventDispatcher:
+    def __init__(self, widgets=(), cell_size=64):
+        self.cell_size = cell_size
+        self.grid = {}
+        self.widgets = []
+        self.focus = None
+        self.hovered = None
+        self.pressed = None
+        self.rebuild(widgets)
+
+    def rebuild(self, widgets):
+        # Buckets every widget rect into a uniform grid so hit tests only look at one cell
+        self.widgets = list(widgets)
+        self.grid = {}
+        size = self.cell_size
+        for order, widget in enumerate(self.widgets):
+            rect = widget.rect
+            for cx in range(rect.left // size, (rect.right - 1) // size + 1):
+                for cy in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                    self.grid.setdefault((cx, cy), []).append((order, widget))
+        if self.focus is not None and self.focus not in self.widgets:
+            self.set_focus(None)
+        self.set_hover(pygame.mouse.get_pos() if pygame.mouse.get_focused() else None)
+
+    def hit_test(self, pos):
+        cell = self.grid.get((pos[0] // self.cell_size, pos[1] // self.cell_size), ())
+        # Later widgets are drawn on top, so they win
+        for order, widget in reversed(cell):
+            if widget.rect.collidepoint(pos):
+                return widget
+        return None
+
+    def set_focus(self, widget):
+        if widget is self.focus:
+            return
+        if self.focus is not None:
+            self.focus.set_active(False)
+        self.focus = widget
+        if widget is not None:
+            widget.set_active(True)
+
+    def set_hover(self, pos):
+        widget = self.hit_test(pos) if pos is not None else None
+        if widget is not self.hovered and self.hovered is not None:
+            self.hovered.hover(None)
+        self.hovered = widget
+        if widget is not None:
+            widget.hover(pos)
+
+    def dispatch(self, event):
+        # Returns the widget that was clicked by this event, if any
+        if event.type == pygame.MOUSEMOTION:
+            self.set_hover(event.pos)
+        elif event.type == pygame.WINDOWLEAVE:
+            self.set_hover(None)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self.pressed = self.hit_test(event.pos)
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            widget = self.hit_test(event.pos)
+            pressed, self.pressed = self.pressed, None
+            self.set_focus(widget if hasattr(widget, "set_active") else None)
+            if widget is not None and widget is pressed:
+                if hasattr(widget, "on_click"):
+                    widget.on_click(event.pos)
+                return widget
+        elif event.type == pygame.MOUSEWHEEL:
+            widget = self.hit_test(pygame.mouse.get_pos())
+            if widget is not None and hasattr(widget, "on_scroll"):
+                widget.on_scroll(event)
+        elif event.type == pygame.KEYDOWN and self.focus is not None:
+            self.focus.handle_event(event)
+            if not self.focus.active:
+                self.focus = None
+        return None
+
+SAVE_EVENT = pygame.event.custom_type()
+
+class SaveWriter:
+    def __init__(self, directory="saves", backups=3):
+        self.directory = directory
+        self.backups = backups
+        self.jobs = queue.Queue()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def save(self, file_name, data, deferred=None):
+        # Snapshot on the caller's thread so later edits to data don't leak into the write,
+        # deferred maps section names to functions that build them on the writer thread instead
+        deferred = dict(deferred or {})
+        if isinstance(data, SaveData):
+            snapshot = data.snapshot(exclude=deferred)
+        else:
+            snapshot = copy.deepcopy({name: value for name, value in data.items() if name not in deferred})
+        snapshot.update(deferred)
+        with self.lock:
+            self.pending[file_name] = self.pending.get(file_name, 0) + 1
+        self.jobs.put((file_name, snapshot))
+
+    def is_saving(self, file_name=None):
+        with self.lock:
+            if file_name is None:
+                return bool(self.pending)
+            return file_name in self.pending
+
+    def post(self, file_name, status, error=None):
+        try:
+            pygame.event.post(pygame.event.Event(SAVE_EVENT, file_name=file_name, status=status, error=error))
+        except pygame.error:
+            pass
+
+    def rotate_backups(self, path):
+        if self.backups <= 0 or not os.path.exists(path):
+            return
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{path}.{i + 1}")
+        # Link or copy rather than move, so the primary file exists until the new one replaces it
+        link_path = f"{path}.1.tmp"
+        if os.path.exists(link_path):
+            os.remove(link_path)
+        try:
+            os.link(path, link_path)
+        except OSError:
+            shutil.copy2(path, link_path)
+        os.replace(link_path, f"{path}.1")
+
+    def write(self, file_name, data):
+        path = os.path.join(self.directory, file_name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            write_save_file(file, data)
+            file.flush()
+            os.fsync(file.fileno())
+        self.rotate_backups(path)
+        os.replace(tmp_path, path)
+        # Make the rename itself durable
+        if hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def worker(self):
+        while True:
+            file_name, data = self.jobs.get()
+            self.post(file_name, "saving")
+            error = None
+            try:
+                self.write(file_name, data)
+            except Exception as e:
+                print(f"Failed to save {file_name}: {e}")
+                error = str(e) or type(e).__name__
+            finally:
+                with self.lock:
+                    self.pending[file_name] -= 1
+                    if not self.pending[file_name]:
+                        del self.pending[file_name]
+                self.jobs.task_done()
+            self.post(file_name, "failed" if error else "saved", error)
+
+    def close(self, timeout=10.0):
+        # Wait for queued saves so quitting never drops a write, but never hang on a dead or stuck worker
+        deadline = time.monotonic() + timeout
+        with self.jobs.all_tasks_done:
+            while self.jobs.unfinished_tasks and self.thread.is_alive():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"Gave up waiting for {self.jobs.unfinished_tasks} pending saves")
+                    break
+                self.jobs.all_tasks_done.wait(min(remaining, 0.1))
+
+save_writer = None
+
+class FrameProfiler:
+    def __init__(self, phases=("events", "update", "draw", "flip", "idle"), capacity=600):
+        self.phases = list(phases)
+        self.colors = [(230, 120, 40), (60, 170, 90), (60, 120, 220), (200, 60, 160), (90, 90, 90)]
+        # Ring buffer, one row per frame and one column per phase
+        self.capacity = capacity
+        self.durations = np.zeros((capacity, len(self.phases)))  # seconds
+        self.offsets = np.zeros((capacity, len(self.phases)))  # start of each phase within its frame
+        self.frame_starts = np.zeros(capacity)
+        self.frames = 0
+        self.row = 0
+        self.last = None
+        self.visible = False
+        self.graph = None
+        self.legend = []
+
+    def begin_frame(self):
+        now = time.perf_counter()
+        self.row = self.frames % self.capacity
+        self.durations[self.row] = 0
+        self.offsets[self.row] = 0
+        self.frame_starts[self.row] = now
+        self.frames += 1
+        self.last = now
+
+    def lap(self, name):
+        # Everything since the previous lap (or the frame start) is charged to this phase
+        now = time.perf_counter()
+        if name not in self.phases:
+            self.phases.append(name)
+            self.colors.append((random.randint(50, 255), random.randint(50, 255), random.randint(50, 255)))
+            self.durations = np.concatenate([self.durations, np.zeros((self.capacity, 1))], axis=1)
+            self.offsets = np.concatenate([self.offsets, np.zeros((self.capacity, 1))], axis=1)
+        column = self.phases.index(name)
+        if self.durations[self.row, column] == 0:
+            self.offsets[self.row, column] = self.last - self.frame_starts[self.row]
+        self.durations[self.row, column] += now - self.last
+        self.last = now
+
+    def history(self):
+        # Rows from oldest to newest
+        count = min(self.frames, self.capacity)
+        return (np.arange(self.frames - count, self.frames)) % self.capacity
+
+    def draw(self, surface, pos, font, size=(300, 100), max_ms=50.0):
+        width, height = size
+        rows = self.history()[-width:]
+        # Stacked bars as one pixel array: every pixel picks the phase whose cumulative height it falls in
+        tops = np.cumsum(self.durations[rows] * 1000, axis=1) * (height / max_ms)
+        layer = (np.arange(height)[None, :, None] >= tops[:, None, :]).sum(axis=2)
+        palette = np.array(self.colors + [(30, 30, 30)], dtype=np.uint8)
+        pixels = np.zeros((width, height, 3), dtype=np.uint8)
+        pixels[:] = palette[-1]
+        pixels[width - len(rows):] = palette[layer][:, ::-1]
+        for budget in (1000 / 60, 1000 / 30):
+            pixels[:, height - 1 - int(budget * height / max_ms)] = (200, 200, 200)
+        if self.graph is None or self.graph.get_size() != size:
+            self.graph = pygame.Surface(size)
+        pygame.surfarray.blit_array(self.graph, pixels)
+        surface.blit(self.graph, pos)
+
+        # Legend with the mean of the last second
+        recent = self.durations[rows[-60:]].mean(axis=0) * 1000 if len(rows) else np.zeros(len(self.phases))
+        if len(self.legend) != len(self.phases) or self.legend[0].font is not font:
+            self.legend = [LiveText(font) for _ in self.phases]
+        for i, name in enumerate(self.phases):
+            y = pos[1] + height + 5 + i * (font.get_height() + 2)
+            pygame.draw.rect(surface, self.colors[i], (pos[0], y + 4, 12, 12))
+            surface.blit(self.legend[i].render(f"{name}: {recent[i]:.2f} ms"), (pos[0] + 18, y))
+
+    def export_chrome_trace(self, path):
+        # Trace event format, loads in chrome://tracing and Perfetto
+        events = []
+        origin = self.frame_starts[self.history()[0]] if self.frames else 0.0
+        for row in self.history():
+            start = (self.frame_starts[row] - origin) * 1e6
+            total = self.durations[row].sum() * 1e6
+            events.append({"name": "frame", "cat": "frame", "ph": "X", "ts": start, "dur": total, "pid": 1, "tid": 1})
+            for column, name in enumerate(self.phases):
+                if self.durations[row, column] > 0:
+                    events.append({"name": name, "cat": "phase", "ph": "X", "ts": start + self.offsets[row, column] * 1e6,
+                                   "dur": self.durations[row, column] * 1e6, "pid": 1, "tid": 1})
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+RECORD_MAGIC = b"TREC"
+RECORD_VERSION = 1
+RECORD_HEADER = struct.Struct("<4sHI")  # magic, version, metadata length
+RECORD_ENTRY = struct.Struct("<BII")  # kind, frame, payload length
+RECORD_FRAME = 0
+RECORD_CHECKPOINT = 1
+RECORD_DT = struct.Struct("<d")
+CHECKPOINT_HEADER = struct.Struct("<BII")  # delta flag, layout length, extras length
+
+def pack_arrays(arrays):
+    # Bytes are stored plane by plane (every first byte, then every second...), so the sign and exponent bytes that
+    # rarely change between checkpoints end up next to each other and XOR to long runs of zeros
+    layout = json.dumps([(name, value.dtype.str, value.shape) for name, value in arrays.items()]).encode("utf-8")
+    planes = [np.ascontiguousarray(value).reshape(-1).view(np.uint8).reshape(-1, value.dtype.itemsize).T.tobytes()
+              for value in arrays.values()]
+    return layout, b"".join(planes)
+
+def unpack_arrays(layout, raw):
+    arrays = {}
+    offset = 0
+    for name, dtype, shape in json.loads(layout):
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        planes = np.frombuffer(raw, np.uint8, size, offset).reshape(dtype.itemsize, -1)
+        arrays[name] = np.ascontiguousarray(planes.T).view(dtype).reshape(shape)
+        offset += size
+    return arrays
+
+def xor_bytes(a, b):
+    return np.bitwise_xor(np.frombuffer(a, np.uint8), np.frombuffer(b, np.uint8)).tobytes()
+
+def encode_events(events):
+    # Only plain values are kept, which covers every attribute the scenes read
+    return json.dumps([[event.type, {key: value for key, value in event.dict.items()
+                                     if value is None or isinstance(value, (bool, int, float, str, tuple, list))}]
+                       for event in events]).encode("utf-8")
+
+def decode_events(data):
+    return [pygame.event.Event(kind, {key: tuple(value) if isinstance(value, list) else value for key, value in attributes.items()})
+            for kind, attributes in json.loads(data)]
+
+class SessionRecorder:
+    def __init__(self, path, meta, interval=600, keyframe_every=10):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.file = open(path, 'wb')
+        meta = json.dumps(meta).encode("utf-8")
+        self.file.write(RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, len(meta)) + meta)
+        self.interval = interval  # frames between checkpoints
+        self.keyframe_every = keyframe_every  # every n-th checkpoint is stored whole, bounding the delta chain on seek
+        self.frames = 0
+        self.checkpoints = 0
+        self.previous = None  # layout and raw bytes of the last checkpoint
+
+    def write(self, kind, payload):
+        self.file.write(RECORD_ENTRY.pack(kind, self.frames, len(payload)) + payload)
+
+    def checkpoint_due(self):
+        return self.frames % self.interval == 0
+
+    def checkpoint(self, arrays, extras):
+        # State at the start of the current frame, XORed against the previous checkpoint so unchanged bytes compress to nothing
+        layout, raw = pack_arrays(arrays)
+        delta = self.previous is not None and self.previous[0] == layout and self.checkpoints % self.keyframe_every != 0
+        data = zlib.compress(xor_bytes(raw, self.previous[1]) if delta else raw, 6)
+        extras = json.dumps(extras).encode("utf-8")
+        self.write(RECORD_CHECKPOINT, CHECKPOINT_HEADER.pack(delta, len(layout), len(extras)) + layout + extras + data)
+        self.previous = (layout, raw)
+        self.checkpoints += 1
+        self.file.flush()
+
+    def frame(self, dt, events):
+        # The frame time fed to the simulation clock and every event polled that frame
+        self.write(RECORD_FRAME, RECORD_DT.pack(dt) + (encode_events(events) if events else b""))
+        self.frames += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+class SessionReplay:
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.data = file.read()
+        magic, version, meta_length = RECORD_HEADER.unpack_from(self.data)
+        if magic != RECORD_MAGIC or version != RECORD_VERSION:
+            raise ValueError("Not a session recording")
+        self.meta = json.loads(self.data[RECORD_HEADER.size:RECORD_HEADER.size + meta_length])
+        self.frames = []  # payload offset and length
+        self.checkpoints = []  # frame, payload offset and length
+        position = RECORD_HEADER.size + meta_length
+        while position + RECORD_ENTRY.size <= len(self.data):
+            kind, frame, length = RECORD_ENTRY.unpack_from(self.data, position)
+            position += RECORD_ENTRY.size
+            if position + length > len(self.data):
+                break  # the session ended mid-write
+            if kind == RECORD_FRAME:
+                self.frames.append((position, length))
+            elif kind == RECORD_CHECKPOINT:
+                self.checkpoints.append((frame, position, length))
+            position += length
+        self.checkpoint_frames = [frame for frame, offset, length in self.checkpoints]
+        dts = [RECORD_DT.unpack_from(self.data, offset)[0] for offset, length in self.frames]
+        self.times = np.concatenate(([0.0], np.cumsum(dts)))  # session time at the start of each frame
+        self.decoded = None  # last checkpoint index and raw bytes, so stepping through checkpoints decodes one delta each
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame(self, i):
+        offset, length = self.frames[i]
+        dt = RECORD_DT.unpack_from(self.data, offset)[0]
+        events = decode_events(self.data[offset + RECORD_DT.size:offset + length]) if length > RECORD_DT.size else []
+        return dt, events
+
+    def frame_at(self, seconds):
+        return int(np.clip(np.searchsorted(self.times, seconds, side="right") - 1, 0, len(self.frames)))
+
+    def checkpoint_before(self, frame):
+        return max(bisect.bisect_right(self.checkpoint_frames, frame) - 1, 0)
+
+    def read_checkpoint(self, k):
+        frame, offset, length = self.checkpoints[k]
+        delta, layout_length, extras_length = CHECKPOINT_HEADER.unpack_from(self.data, offset)
+        offset += CHECKPOINT_HEADER.size
+        layout = self.data[offset:offset + layout_length]
+        extras = json.loads(self.data[offset + layout_length:offset + layout_length + extras_length])
+        data = zlib.decompress(self.data[offset + layout_length + extras_length:offset + length])
+        return delta, layout, extras, data
+
+    def checkpoint(self, k):
+        # Walks back to the nearest whole checkpoint and applies the deltas forward
+        chain = []
+        start = k
+        while start >= 0:
+            if self.decoded is not None and self.decoded[0] == start:
+                break
+            chain.append(start)
+            if not self.read_checkpoint(start)[0]:
+                break
+            start -= 1
+        raw = self.decoded[1] if self.decoded is not None and self.decoded[0] == start else None
+        for i in reversed(chain):
+            delta, layout, extras, data = self.read_checkpoint(i)
+            raw = xor_bytes(data, raw) if delta else data
+        self.decoded = (k, raw)
+        delta, layout, extras, data = self.read_checkpoint(k)
+        return self.checkpoints[k][0], unpack_arrays(layout, raw), extras
+
+G = 6.6743e-11
+GAS_CONSTANT = 8.314462618
+
+# Yoshida 4th order symplectic coefficients
+YOSHIDA_W1 = 1 / (2 - 2 ** (1 / 3))
+YOSHIDA_W0 = -(2 ** (1 / 3)) * YOSHIDA_W1
+YOSHIDA_C = (YOSHIDA_W1 / 2, (YOSHIDA_W0 + YOSHIDA_W1) / 2, (YOSHIDA_W0 + YOSHIDA_W1) / 2, YOSHIDA_W1 / 2)
+YOSHIDA_D = (YOSHIDA_W1, YOSHIDA_W0, YOSHIDA_W1)
+
+def compensated_add(total, error, delta):
+    # Kahan summation, keeps the low bits that a plain += on large positions would drop
+    y = delta - error
+    t = total + y
+    error[...] = (t - total) - y
+    total[...] = t
+
+def solve_kepler(mean_anomaly, e, iterations=50, tolerance=1e-13):
+    # Vectorized Newton solve of Kepler's equation, elliptic (E - e sin E = M) and hyperbolic (e sinh H - H = M)
+    M, e = np.broadcast_arrays(np.asarray(mean_anomaly, dtype=float), np.asarray(e, dtype=float))
+    elliptic = e < 1
+    M = np.where(elliptic, np.remainder(M + np.pi, 2 * np.pi) - np.pi, M)
+    E = np.where(elliptic, M + 0.85 * e * np.sign(np.sin(M)), np.arcsinh(M / np.maximum(e, 1)))
+    for _ in range(iterations):
+        f = np.where(elliptic, E - e * np.sin(E) - M, e * np.sinh(E) - E - M)
+        fp = np.where(elliptic, 1 - e * np.cos(E), e * np.cosh(E) - 1)
+        delta = f / fp
+        E = E - delta
+        if np.all(np.abs(delta) < tolerance * np.maximum(1, np.abs(E))):
+            break
+    return E
+
+def orbital_elements(r, v, mu):
+    # r, v are (k, 3) states relative to the parent, mu is (k,)
+    rn = np.linalg.norm(r, axis=1)
+    h = np.cross(r, v)
+    hn = np.linalg.norm(h, axis=1)
+    e_vec = np.cross(v, h) / mu[:, None] - r / rn[:, None]
+    e = np.linalg.norm(e_vec, axis=1)
+    # Exactly parabolic orbits have no finite semi-major axis
+    e = np.where(np.abs(e - 1) < 1e-9, 1 + 1e-9, e)
+    energy = np.einsum("ij,ij->i", v, v) / 2 - mu / rn
+    a = -mu / (2 * energy)
+    circular = e < 1e-10
+    P = np.where(circular[:, None], r / rn[:, None], e_vec / np.where(circular, 1, e)[:, None])
+    Q = np.cross(h / hn[:, None], P)
+    nu = np.arctan2(np.einsum("ij,ij->i", r, Q), np.einsum("ij,ij->i", r, P))
+    elliptic = e < 1
+    with np.errstate(invalid="ignore"):
+        E = np.arctan2(np.sqrt(np.maximum(1 - e * e, 0)) * np.sin(nu), e + np.cos(nu))
+        H = 2 * np.arctanh(np.sqrt(np.maximum(e - 1, 0) / (e + 1)) * np.tan(nu / 2))
+    M0 = np.where(elliptic, E - e * np.sin(E), e * np.sinh(np.nan_to_num(H)) - np.nan_to_num(H))
+    n = np.sqrt(mu / np.abs(a) ** 3)
+    return a, e, n, M0, P, Q
+
+def kepler_state(a, e, n, M0, P, Q, dt):
+    # Position and velocity relative to the parent after dt seconds on the conic
+    E = solve_kepler(M0 + n * dt, e)
+    elliptic = e < 1
+    with np.errstate(over="ignore", invalid="ignore"):
+        cos_e = np.where(elliptic, np.cos(E), np.cosh(E))
+        sin_e = np.where(elliptic, np.sin(E), np.sinh(E))
+        b = np.where(elliptic, a * np.sqrt(np.abs(1 - e * e)), -a * np.sqrt(np.abs(e * e - 1)))
+        rate = n / np.where(elliptic, 1 - e * cos_e, e * cos_e - 1)
+    x = a * (cos_e - e)
+    y = b * sin_e
+    vx = np.where(elliptic, -a * sin_e, a * sin_e) * rate
+    vy = b * cos_e * rate
+    return x[:, None] * P + y[:, None] * Q, vx[:, None] * P + vy[:, None] * Q
+
+def expand_ranges(starts, counts):
+    # Concatenated aranges: start, start + 1, ... for every (start, count)
+    offsets = np.cumsum(counts) - counts
+    return np.arange(counts.sum()) - np.repeat(offsets - starts, counts)
+
+def spread_bits(values):
+    # Moves the low 21 bits of each value three bits apart, for interleaving into Morton keys
+    v = values.astype(np.uint64) & np.uint64(0x1fffff)
+    for shift, mask in ((32, 0x1f00000000ffff), (16, 0x1f0000ff0000ff), (8, 0x100f00f00f00f00f),
+                        (4, 0x10c30c30c30c30c3), (2, 0x1249249249249249)):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+# Below this many (target, source) pairs summing every pair directly is cheaper than building a tree
+DIRECT_PAIRS = 1 << 18
+
+class GravityTree:
+    def __init__(self, positions, gm, theta=0.7, leaf_size=16, softening=0.0):
+        # Linear octree: bodies sorted along a Morton curve, so every node is a contiguous run of them
+        self.theta = theta
+        self.softening = softening
+        n = len(gm)
+        low = positions.min(axis=0)
+        extent = max(float((positions.max(axis=0) - low).max()), 1.0) * (1 + 1e-9)
+        cells = ((positions - low) * ((1 << 21) / extent)).astype(np.int64)
+        keys = (spread_bits(cells[:, 0]) << np.uint64(2)) | (spread_bits(cells[:, 1]) << np.uint64(1)) | spread_bits(cells[:, 2])
+        self.order = np.argsort(keys, kind="stable")
+        self.rank = np.empty(n, dtype=np.intp)  # sorted position of each input body
+        self.rank[self.order] = np.arange(n)
+        keys = keys[self.order]
+        self.x, self.y, self.z = (np.ascontiguousarray(positions[self.order, k]) for k in range(3))
+        self.gm = gm[self.order]
+        # Prefix sums turn every node's mass and mass moment into two lookups
+        sums = [np.concatenate(([0.0], np.cumsum(values))) for values in (self.gm, self.gm * self.x, self.gm * self.y, self.gm * self.z)]
+
+        levels = []
+        active = np.ones(n, dtype=bool)
+        for level in range(22):
+            prefix = keys >> np.uint64(3 * (21 - level))
+            start = np.flatnonzero(np.concatenate(([True], prefix[1:] != prefix[:-1])))
+            end = np.append(start[1:], n)
+            # Bodies that already sit in a leaf stop subdividing
+            keep = active[start]
+            start, end = start[keep], end[keep]
+            leaf = (end - start <= leaf_size) | (level == 21)
+            levels.append((start, end, leaf, extent / 2 ** level))
+            marks = np.zeros(n + 1, dtype=int)
+            np.add.at(marks, start[~leaf], 1)
+            np.add.at(marks, end[~leaf], -1)
+            active = np.cumsum(marks[:n]) > 0
+            if not active.any():
+                break
+
+        offsets = np.cumsum([0] + [len(start) for start, end, leaf, size in levels])
+        child_start, child_end = [], []
+        for level, (start, end, leaf, size) in enumerate(levels):
+            if level + 1 < len(levels):
+                below = levels[level + 1][0]
+                first = np.searchsorted(below, start) + offsets[level + 1]
+                last = np.searchsorted(below, end) + offsets[level + 1]
+            else:
+                first = last = np.zeros(len(start), dtype=int)
+            child_start.append(np.where(leaf, 0, first))
+            child_end.append(np.where(leaf, 0, last))
+        self.start = np.concatenate([start for start, end, leaf, size in levels])
+        self.end = np.concatenate([end for start, end, leaf, size in levels])
+        self.leaf = np.concatenate([leaf for start, end, leaf, size in levels])
+        self.size = np.concatenate([np.full(len(start), size) for start, end, leaf, size in levels])
+        self.child_start = np.concatenate(child_start)
+        self.child_end = np.concatenate(child_end)
+        self.mass = sums[0][self.end] - sums[0][self.start]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.cx, self.cy, self.cz = ((total[self.end] - total[self.start]) / self.mass for total in sums[1:])
+
+    def accelerations(self, positions, pool=None, workers=1):
+        # Pull on arbitrary points, e.g. vessels, each point walks the tree on its own
+        t = len(positions)
+        x, y, z = (np.ascontiguousarray(positions[:, k]) for k in range(3))
+        groups = (x, y, z, np.zeros(t), np.arange(t), np.ones(t, dtype=int))
+        return self.walk(groups, x, y, z, np.full(t, -1), pool, workers)
+
+    def self_accelerations(self, pool=None, workers=1):
+        # Pull on the tree's own bodies in input order. Every leaf walks the tree once for all its bodies, so a node
+        # is only accepted when it is far from the leaf's whole bounding sphere
+        leaves = np.flatnonzero(self.leaf)
+        leaves = leaves[np.argsort(self.start[leaves])]
+        counts = self.end[leaves] - self.start[leaves]
+        member = np.repeat(leaves, counts)
+        radius = np.sqrt((self.x - self.cx[member]) ** 2 + (self.y - self.cy[member]) ** 2 + (self.z - self.cz[member]) ** 2)
+        groups = (self.cx[leaves], self.cy[leaves], self.cz[leaves], np.maximum.reduceat(radius, self.start[leaves]),
+                  self.start[leaves], counts)
+        return self.walk(groups, self.x, self.y, self.z, np.arange(len(self.x)), pool, workers)[self.rank]
+
+    def walk(self, groups, x, y, z, skip, pool, workers):
+        # One chunk of groups per worker of the pool
+        if pool is None or workers < 2 or len(groups[0]) < 256:
+            parts = [tree_walk(self, groups, x, y, z, skip)]
+        else:
+            chunks = np.array_split(np.arange(len(groups[0])), workers)
+            parts = pool.starmap(tree_walk, [(self, tuple(column[c] for column in groups), x, y, z, skip) for c in chunks])
+        # Every target belongs to exactly one group, so the parts add up without overlap
+        return np.stack([sum(axis) for axis in zip(*parts)], axis=1)
+
+def tree_walk(tree, groups, x, y, z, skip):
+    # Refines a frontier of (group, node) pairs level by level until every pair was accepted or summed directly.
+    # skip holds each target's own position in the tree, so no body pulls on itself
+    gx, gy, gz, gr, first, count = groups
+    t = len(x)
+    acc = [np.zeros(t), np.zeros(t), np.zeros(t)]
+    eps2 = tree.softening ** 2
+
+    def pull(targets, gm, dx, dy, dz):
+        r2 = dx * dx + dy * dy + dz * dz + eps2
+        r2[r2 == 0] = np.inf
+        w = gm * r2 ** -1.5
+        for axis, d in zip(acc, (dx, dy, dz)):
+            axis += np.bincount(targets, w * d, minlength=t)
+
+    group = np.arange(len(gx))
+    nodes = np.zeros(len(gx), dtype=np.intp)
+    while len(group):
+        d = np.sqrt((tree.cx[nodes] - gx[group]) ** 2 + (tree.cy[nodes] - gy[group]) ** 2 + (tree.cz[nodes] - gz[group]) ** 2)
+        far = tree.size[nodes] < tree.theta * (d - gr[group])
+        # A distant node pulls on every body of the group like one body at its center of mass
+        targets = expand_ranges(first[group[far]], count[group[far]])
+        node = np.repeat(nodes[far], count[group[far]])
+        pull(targets, tree.mass[node], tree.cx[node] - x[targets], tree.cy[node] - y[targets], tree.cz[node] - z[targets])
+        # Close leaves are summed body by body
+        close = ~far & tree.leaf[nodes]
+        targets = expand_ranges(first[group[close]], count[group[close]])
+        node = np.repeat(nodes[close], count[group[close]])
+        sizes = tree.end[node] - tree.start[node]
+        bodies = expand_ranges(tree.start[node], sizes)
+        targets = np.repeat(targets, sizes)
+        other = bodies != skip[targets]
+        targets, bodies = targets[other], bodies[other]
+        pull(targets, tree.gm[bodies], tree.x[bodies] - x[targets], tree.y[bodies] - y[targets], tree.z[bodies] - z[targets])
+        # Anything else opens up into its children
+        opened = ~far & ~tree.leaf[nodes]
+        children = tree.child_end[nodes[opened]] - tree.child_start[nodes[opened]]
+        nodes = expand_ranges(tree.child_start[nodes[opened]], children)
+        group = np.repeat(group[opened], children)
+    return acc
+
+# Half of the 26 neighbouring cells, together with the cell itself every pair of neighbouring cells is visited once
+HALF_NEIGHBOURS = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1) if (dx, dy, dz) > (0, 0, 0)]
+
+def hash_cells(cells):
+    # Wraps each cell coordinate to 21 bits, far apart cells that share a key only add candidates that fail the distance test
+    wrapped = cells & ((1 << 21) - 1)
+    return (wrapped[..., 0] << 42) | (wrapped[..., 1] << 21) | wrapped[..., 2]
+
+class SpatialHash:
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+
+    def build(self, positions):
+        self.positions = positions
+        cells = np.floor(positions / self.cell_size).astype(np.int64)
+        keys = hash_cells(cells)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+        # Kept in key order, shifting every cell by the same offset leaves the keys almost sorted and searchsorted fast
+        self.cells = cells[self.order]
+        # Occupied cells with the range of bodies in each
+        self.first = np.flatnonzero(np.diff(self.keys, prepend=self.keys[:1] - 1))
+        self.occupied = self.keys[self.first]
+        self.sizes = np.diff(np.append(self.first, len(self.keys)))
+
+    def lookup(self, keys):
+        # Start and length of each key's range in key order, empty for unoccupied cells
+        if not len(self.occupied):
+            return np.zeros(len(keys), dtype=int), np.zeros(len(keys), dtype=int)
+        cell = np.minimum(np.searchsorted(self.occupied, keys), len(self.occupied) - 1)
+        return self.first[cell], np.where(self.occupied[cell] == keys, self.sizes[cell], 0)
+
+    def neighbours(self, offset):
+        # Every (i, j) where j is in the cell at offset from i's cell
+        lo, counts = self.lookup(hash_cells(self.cells + offset))
+        return self.order[np.repeat(np.arange(len(counts)), counts)], self.order[expand_ranges(lo, counts)]
+
+    def pairs(self, radii):
+        # Bodies closer than the sum of their radii, the cell size has to be at least the largest diameter
+        found = [np.empty((0, 2), dtype=int)]
+        for offset in [(0, 0, 0)] + HALF_NEIGHBOURS:
+            i, j = self.neighbours(np.array(offset))
+            keep = i < j if offset == (0, 0, 0) else i != j
+            i, j = i[keep], j[keep]
+            d = self.positions[i] - self.positions[j]
+            touching = np.einsum("ij,ij->i", d, d) < (radii[i] + radii[j]) ** 2
+            found.append(np.stack([np.minimum(i, j)[touching], np.maximum(i, j)[touching]], axis=1))
+        return np.unique(np.concatenate(found), axis=0)
+
+    def query(self, point, radius):
+        # Indices of every body within radius of point
+        point = np.asarray(point, dtype=float)
+        low = np.floor((point - radius) / self.cell_size).astype(np.int64)
+        high = np.floor((point + radius) / self.cell_size).astype(np.int64)
+        if np.prod(high - low + 1) > len(self.keys):
+            candidates = np.arange(len(self.keys))
+        else:
+            axes = [np.arange(lo, hi + 1) for lo, hi in zip(low, high)]
+            cells = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+            keys = np.unique(hash_cells(cells))
+            lo, counts = self.lookup(keys)
+            candidates = self.order[expand_ranges(lo, counts)]
+        d = self.positions[candidates] - point
+        return np.sort(candidates[np.einsum("ij,ij->i", d, d) <= radius ** 2])
+
+class PhysicsWorld:
+    COLUMNS = ["pos", "vel", "pos_error", "vel_error", "mass", "gm", "radius", "thrust", "drag_area", "minor", "parent", "depth",
+               "soi", "rails", "rail_a", "rail_e", "rail_n", "rail_m0", "rail_p", "rail_q", "rail_epoch"]
+
+    def __init__(self, capacity=16, integrator="yoshida", softening=0.0, soi_margin=0.1, theta=0.7, leaf_size=16, workers=0):
+        self.integrator = integrator
+        self.softening = softening
+        # Minor bodies pull through a Barnes-Hut tree, workers > 1 splits its traversal over a process pool
+        self.theta = theta
+        self.leaf_size = leaf_size
+        self.workers = workers
+        self.pool = None
+        self.pool_workers = 0  # processes in self.pool, workers may change after it was created
+        self.soi_margin = soi_margin  # bodies this close (as a fraction) to an SOI edge are integrated
+        self.count = 0
+        self.names = []
+        self.pos = np.zeros((capacity, 3))
+        self.vel = np.zeros((capacity, 3))
+        self.pos_error = np.zeros((capacity, 3))
+        self.vel_error = np.zeros((capacity, 3))
+        self.mass = np.zeros(capacity)
+        self.gm = np.zeros(capacity)
+        self.radius = np.zeros(capacity)
+        self.thrust = np.zeros((capacity, 3))  # acceleration from engines, forces numeric integration
+        self.drag_area = np.zeros(capacity)  # drag reference area per kilogram, 0 for bodies that ignore air
+        self.minor = np.zeros(capacity, dtype=bool)  # asteroids and the like, their gravity is approximated
+        self.atmospheres = {}  # body row -> Atmosphere
+        self.parent = np.full(capacity, -1)
+        self.depth = np.zeros(capacity, dtype=int)
+        self.soi = np.full(capacity, np.inf)
+        # On-rails bodies follow a fixed conic around their parent
+        self.rails = np.zeros(capacity, dtype=bool)
+        self.rail_a = np.zeros(capacity)
+        self.rail_e = np.zeros(capacity)
+        self.rail_n = np.zeros(capacity)
+        self.rail_m0 = np.zeros(capacity)
+        self.rail_p = np.zeros((capacity, 3))
+        self.rail_q = np.zeros((capacity, 3))
+        self.rail_epoch = np.zeros(capacity)
+        self.time = 0.0
+
+    def grow(self, capacity):
+        for name in self.COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add_body(self, name, mass, position, velocity, parent=-1, radius=None, drag_area=0.0, minor=False):
+        if self.count == len(self.mass):
+            self.grow(len(self.mass) * 2)
+        i = self.count
+        self.names.append(name)
+        self.pos[i] = position
+        self.vel[i] = velocity
+        self.pos_error[i] = 0
+        self.vel_error[i] = 0
+        self.mass[i] = mass
+        self.gm[i] = G * mass
+        # Without a measured radius assume a rocky body (5500 kg/m^3)
+        self.radius[i] = radius if radius is not None else (3 * mass / (4 * np.pi * 5500)) ** (1 / 3)
+        self.thrust[i] = 0
+        self.drag_area[i] = drag_area
+        self.minor[i] = minor
+        self.parent[i] = parent
+        self.depth[i] = self.depth[parent] + 1 if parent >= 0 else 0
+        self.soi[i] = np.inf
+        self.rails[i] = False
+        self.count += 1
+        return i
+
+    def index(self, name):
+        return self.names.index(name)
+
+    def free_rows(self):
+        return np.flatnonzero(~self.rails[:self.count])
+
+    def accelerations(self, rows=None):
+        n = self.count
+        if rows is None:
+            rows = np.arange(n)
+        pos = self.pos[:n]
+        # Only bodies with mass pull on others, vessels and debris are test particles
+        massive = np.flatnonzero((self.gm[:n] > 0) & ~self.minor[:n])
+        d = pos[massive][None, :, :] - pos[rows][:, None, :]
+        r2 = np.einsum("ijk,ijk->ij", d, d) + self.softening ** 2
+        r2[r2 == 0] = np.inf
+        acc = np.einsum("ij,ijk->ik", self.gm[massive] * r2 ** -1.5, d) + self.thrust[rows]
+        if self.minor[:n].any():
+            acc += self.minor_gravity(rows)
+        return acc
+
+    def minor_gravity(self, rows):
+        # The tree is rebuilt from the current positions on every call, building it is cheap next to walking it
+        n = self.count
+        minor = np.flatnonzero(self.minor[:n] & (self.gm[:n] > 0))
+        if not len(minor):
+            return np.zeros((len(rows), 3))
+        if len(rows) * len(minor) <= DIRECT_PAIRS:
+            # A few free bodies, e.g. vessels, against a belt on rails
+            d = self.pos[minor][None, :, :] - self.pos[rows][:, None, :]
+            r2 = np.einsum("ijk,ijk->ij", d, d) + self.softening ** 2
+            r2[r2 == 0] = np.inf
+            return np.einsum("ij,ijk->ik", self.gm[minor] * r2 ** -1.5, d)
+        tree = GravityTree(self.pos[minor], self.gm[minor], self.theta, self.leaf_size, self.softening)
+        if self.workers > 1 and self.pool is None:
+            # Spawned like the prediction worker, forking next to the save writer thread could copy a held lock
+            self.pool = multiprocessing.get_context("spawn").Pool(self.workers)
+            self.pool_workers = self.workers
+        member = np.full(n, -1)
+        member[minor] = np.arange(len(minor))
+        inside = member[rows] >= 0
+        acc = np.zeros((len(rows), 3))
+        if inside.any():
+            acc[inside] = tree.self_accelerations(self.pool, self.pool_workers)[member[rows[inside]]]
+        if not inside.all():
+            acc[~inside] = tree.accelerations(self.pos[rows[~inside]], self.pool, self.pool_workers)
+        return acc
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+            self.pool_workers = 0
+
+    def collide(self):
+        # Touching minor bodies merge, keeping mass and momentum. Returns each old row's new index, or None without collisions.
+        # Bodies on rails keep their fixed orbits, so only pairs with at least one free body are looked for
+        n = self.count
+        minor = np.flatnonzero(self.minor[:n])
+        free = minor[~self.rails[minor]]
+        if not len(free) or len(minor) < 2:
+            return None
+        reach = 2 * self.radius[minor].max()
+        # Only the rails bodies inside the free bodies' bounding box can touch one of them
+        railed = minor[self.rails[minor]]
+        low, high = self.pos[free].min(axis=0) - reach, self.pos[free].max(axis=0) + reach
+        near = railed[np.all((self.pos[railed] >= low) & (self.pos[railed] <= high), axis=1)]
+        candidates = np.concatenate([free, near])
+        grid = SpatialHash(reach)
+        grid.build(self.pos[candidates])
+        pairs = candidates[grid.pairs(self.radius[candidates])]
+        pairs = pairs[~(self.rails[pairs[:, 0]] & self.rails[pairs[:, 1]])]
+        if not len(pairs):
+            return None
+        absorbed = set()
+        for i, j in pairs:
+            if i in absorbed or j in absorbed:
+                continue
+            if self.mass[j] > self.mass[i]:
+                i, j = j, i
+            mass = self.mass[i] + self.mass[j]
+            self.pos[i] = (self.mass[i] * self.pos[i] + self.mass[j] * self.pos[j]) / mass
+            self.vel[i] = (self.mass[i] * self.vel[i] + self.mass[j] * self.vel[j]) / mass
+            self.radius[i] = (self.radius[i] ** 3 + self.radius[j] ** 3) ** (1 / 3)
+            self.mass[i] = mass
+            self.gm[i] = G * mass
+            self.pos_error[i] = 0
+            self.vel_error[i] = 0
+            if self.rails[i]:
+                self.put_on_rails([i])
+            absorbed.add(j)
+        return self.remove_bodies(sorted(absorbed))
+
+    def remove_bodies(self, rows):
+        # Compacts every column, returns each old row's new index with -1 for the removed ones
+        n = self.count
+        keep = np.ones(n, dtype=bool)
+        keep[rows] = False
+        count = int(keep.sum())
+        remap = np.full(n, -1)
+        remap[keep] = np.arange(count)
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            column[:count] = column[:n][keep]
+        self.names = [name for name, kept in zip(self.names, keep) if kept]
+        self.count = count
+        parent = self.parent[:count]
+        self.parent[:count] = np.where(parent >= 0, remap[parent], -1)
+        self.atmospheres = {remap[body]: atmosphere for body, atmosphere in self.atmospheres.items() if keep[body]}
+        return remap
+
+    def air(self, rows, body):
+        # Altitudes above the body and the indices (into rows) of the bodies inside its atmosphere that feel drag
+        d = self.pos[rows] - self.pos[body]
+        altitude = np.sqrt(np.einsum("ij,ij->i", d, d)) - self.radius[body]
+        inside = np.flatnonzero((altitude < self.atmospheres[body].top) & (self.drag_area[rows] > 0))
+        return altitude[inside], inside
+
+    def drag(self, rows, dt):
+        # Velocity change over dt for every body in the air, one batch per atmosphere, the air moves with its body.
+        # Quadratic drag at a fixed rate decays as v / (1 + rate dt), so a long step can never overshoot
+        dv = np.zeros((len(rows), 3))
+        for body, atmosphere in self.atmospheres.items():
+            altitude, inside = self.air(rows, body)
+            if len(inside):
+                r = rows[inside]
+                v = self.vel[r] - self.vel[body]
+                decay = atmosphere.drag_rate(altitude, v, self.drag_area[r]) * dt
+                dv[inside] -= (decay / (1 + decay))[:, None] * v
+        return dv
+
+    def in_atmosphere(self, rows):
+        inside = np.zeros(len(rows), dtype=bool)
+        for body in self.atmospheres:
+            inside[self.air(rows, body)[1]] = True
+        return inside
+
+    def add_to_rows(self, values, errors, rows, delta):
+        if len(rows) == self.count:
+            compensated_add(values[:self.count], errors[:self.count], delta)
+        else:
+            total, error = values[rows], errors[rows]
+            compensated_add(total, error, delta)
+            values[rows], errors[rows] = total, error
+
+    def kick(self, rows, dt):
+        self.add_to_rows(self.vel, self.vel_error, rows, self.accelerations(rows) * dt)
+
+    def drift(self, rows, dt, time):
+        self.add_to_rows(self.pos, self.pos_error, rows, self.vel[rows] * dt)
+        # Minor bodies on rails only catch up once per step in step(), their pull barely changes within one
+        self.update_rails(time, minor=False)
+
+    def step(self, dt, steps=1):
+        free = self.free_rows()
+        if len(free) == 0:
+            # Everything is on rails, so any amount of time warp costs a single Kepler solve
+            self.time += dt * steps
+            self.update_rails(self.time)
+            return
+        for _ in range(steps):
+            start = self.time
+            if self.integrator == "leapfrog":
+                self.kick(free, dt / 2)
+                self.drift(free, dt, start + dt)
+                self.kick(free, dt / 2)
+            else:
+                elapsed = 0.0
+                for c, d in zip(YOSHIDA_C, YOSHIDA_D + (None,)):
+                    elapsed += c
+                    self.drift(free, c * dt, start + elapsed * dt)
+                    if d is not None:
+                        self.kick(free, d * dt)
+            if self.atmospheres:
+                # Applied once per step, outside the symplectic substeps since one of them runs backwards in time
+                self.add_to_rows(self.vel, self.vel_error, free, self.drag(free, dt))
+            self.time = start + dt
+            self.update_rails(self.time)
+
+    def put_on_rails(self, rows, parents=None):
+        rows = np.atleast_1d(np.asarray(rows, dtype=int))
+        if parents is not None:
+            self.parent[rows] = parents
+            for i in rows:
+                self.depth[i] = self.depth[self.parent[i]] + 1 if self.parent[i] >= 0 else 0
+        self.rail_epoch[rows] = self.time
+        self.rail_p[rows] = self.pos[rows]
+        self.rail_q[rows] = self.vel[rows]
+        orbiting = rows[self.parent[rows] >= 0]
+        if len(orbiting):
+            parent = self.parent[orbiting]
+            mu = self.gm[parent] + self.gm[orbiting]
+            r = self.pos[orbiting] - self.pos[parent]
+            v = self.vel[orbiting] - self.vel[parent]
+            a, e, n, M0, P, Q = orbital_elements(r, v, mu)
+            self.rail_a[orbiting], self.rail_e[orbiting], self.rail_n[orbiting], self.rail_m0[orbiting] = a, e, n, M0
+            self.rail_p[orbiting], self.rail_q[orbiting] = P, Q
+            # Laplace sphere of influence for bodies that other things can orbit
+            massive = orbiting[self.gm[orbiting] > 0]
+            self.soi[massive] = np.abs(self.rail_a[massive]) * (self.gm[massive] / self.gm[self.parent[massive]]) ** 0.4
+        self.rails[rows] = True
+        self.pos_error[rows] = 0
+        self.vel_error[rows] = 0
+
+    def take_off_rails(self, rows):
+        # Positions and velocities are kept current by update_rails, so integration just picks up from them
+        self.rails[np.atleast_1d(rows)] = False
+
+    def update_rails(self, time, minor=True):
+        n = self.count
+        rails = self.rails[:n] if minor else self.rails[:n] & ~self.minor[:n]
+        if not rails.any():
+            return
+        # Parents are resolved before their children so moons follow their planet's new position
+        for depth in range(self.depth[:n][rails].max() + 1):
+            rows = np.flatnonzero(rails & (self.depth[:n] == depth))
+            if len(rows) == 0:
+                continue
+            dt = time - self.rail_epoch[rows]
+            roots = rows[self.parent[rows] < 0]
+            if len(roots):
+                # A body without a parent just coasts, rail_p/rail_q hold its epoch state
+                self.pos[roots] = self.rail_p[roots] + self.rail_q[roots] * dt[self.parent[rows] < 0][:, None]
+                self.vel[roots] = self.rail_q[roots]
+            orbiting = rows[self.parent[rows] >= 0]
+            if len(orbiting):
+                r, v = kepler_state(self.rail_a[orbiting], self.rail_e[orbiting], self.rail_n[orbiting], self.rail_m0[orbiting],
+                                    self.rail_p[orbiting], self.rail_q[orbiting], time - self.rail_epoch[orbiting])
+                parent = self.parent[orbiting]
+                self.pos[orbiting] = self.pos[parent] + r
+                self.vel[orbiting] = self.vel[parent] + v
+
+    def dominant_bodies(self, rows):
+        # Patched conics: the innermost sphere of influence containing each body
+        n = self.count
+        massive = np.flatnonzero((self.gm[:n] > 0) & ~self.minor[:n])
+        d = np.linalg.norm(self.pos[rows][:, None, :] - self.pos[massive][None, :, :], axis=2)
+        ratio = d / self.soi[massive][None, :]
+        ratio[rows[:, None] == massive[None, :]] = np.inf
+        inside = ratio < 1
+        # The root body's SOI is infinite, so it only wins when nothing smaller contains the body
+        soi = np.minimum(self.soi[massive], np.finfo(float).max)
+        best = np.argmin(np.where(inside, soi[None, :], np.inf), axis=1)
+        dominant = np.where(inside.any(axis=1), massive[best], -1)
+        near_edge = np.any(np.abs(ratio - 1) < self.soi_margin, axis=1)
+        return dominant, near_edge
+
+    def update_propagation(self):
+        # Moves massless bodies between rails and integration, and re-parents them on SOI crossings
+        n = self.count
+        rows = np.flatnonzero(self.gm[:n] == 0)
+        if len(rows) == 0:
+            return
+        dominant, near_edge = self.dominant_bodies(rows)
+        thrusting = np.any(self.thrust[rows] != 0, axis=1)
+        # Drag is not a conic, anything in the air has to be integrated
+        integrate = near_edge | thrusting | (dominant < 0) | self.in_atmosphere(rows)
+        rails = self.rails[rows]
+        self.take_off_rails(rows[rails & integrate])
+        crossed = rails & ~integrate & (dominant != self.parent[rows])
+        settle = ~rails & ~integrate
+        if crossed.any() or settle.any():
+            self.put_on_rails(rows[crossed | settle], dominant[crossed | settle])
+
+    def energy(self):
+        n = self.count
+        kinetic = 0.5 * np.sum(self.mass[:n] * np.einsum("ij,ij->i", self.vel[:n], self.vel[:n]))
+        d = self.pos[:n][None, :, :] - self.pos[:n][:, None, :]
+        r = np.sqrt(np.einsum("ijk,ijk->ij", d, d))
+        i, j = np.triu_indices(n, 1)
+        potential = -np.sum(G * self.mass[i] * self.mass[j] / r[i, j])
+        return kinetic + potential
+
+    def center_momentum(self):
+        n = self.count
+        total_mass = np.sum(self.mass[:n])
+        if total_mass > 0:
+            self.vel[:n] -= np.sum(self.mass[:n, None] * self.vel[:n], axis=0) / total_mass
+            self.pos[:n] -= np.sum(self.mass[:n, None] * self.pos[:n], axis=0) / total_mass
+
+    def to_dict(self):
+        n = self.count
+        return {
+            "time": self.time,
+            "bodies": [
+                {
+                    "name": self.names[i],
+                    "mass": float(self.mass[i]),
+                    "radius": float(self.radius[i]),
+                    "drag_area": float(self.drag_area[i]),
+                    "minor": bool(self.minor[i]),
+                    "position": self.pos[i].tolist(),
+                    "velocity": self.vel[i].tolist(),
+                    "parent": self.names[self.parent[i]] if self.parent[i] >= 0 else None,
+                    "rails": bool(self.rails[i]),
+                }
+                for i in range(n)
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        world = cls(capacity=max(len(data["bodies"]), 1))
+        world.time = data.get("time", 0.0)
+        for body in data["bodies"]:
+            parent = world.index(body["parent"]) if body.get("parent") else -1
+            world.add_body(body["name"], body["mass"], body["position"], body["velocity"], parent, body.get("radius"),
+                           body.get("drag_area", 0.0), body.get("minor", False))
+        rails = [i for i, body in enumerate(data["bodies"]) if body.get("rails")]
+        if rails:
+            world.put_on_rails(rails)
+        return world
+
+    def snapshot(self, rows=None):
+        n = self.count
+        rows = np.arange(n) if rows is None else rows
+        # New index of every kept row, the extra last entry maps a parent of -1 to -1
+        index = np.full(n + 1, -1)
+        index[rows] = np.arange(len(rows))
+        return {
+            "time": self.time,
+            "pos": self.pos[rows],
+            "vel": self.vel[rows],
+            "mass": self.mass[rows],
+            "thrust": self.thrust[rows],
+            "parent": index[self.parent[rows]],
+            "rails": self.rails[rows],
+            "radius": self.radius[rows],
+            "drag_area": self.drag_area[rows],
+            "minor": self.minor[rows],
+            # Atmospheres of bodies left out of the snapshot are dropped with them
+            "atmospheres": {int(index[body]): atmosphere for body, atmosphere in self.atmospheres.items() if index[body] >= 0},
+        }
+
+    def state(self):
+        # Every column including the compensation terms, so a restored world steps bit for bit like this one
+        state = {name: getattr(self, name)[:self.count].copy() for name in self.COLUMNS}
+        state["time"] = np.array([self.time])
+        return state
+
+    def copy(self):
+        # Columns only, atmospheres and the process pool stay with this world
+        world = PhysicsWorld(capacity=max(self.count, 1))
+        world.load_state(self.state(), self.names)
+        return world
+
+    def load_state(self, state, names):
+        count = len(names)
+        if count > len(self.mass):
+            self.grow(count)
+        for name in self.COLUMNS:
+            getattr(self, name)[:count] = state[name]
+        self.names = list(names)
+        self.count = count
+        self.time = float(state["time"][0])
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        world = cls(capacity=max(len(snapshot["mass"]), 1))
+        world.time = snapshot["time"]
+        for i in range(len(snapshot["mass"])):
+            world.add_body(str(i), snapshot["mass"][i], snapshot["pos"][i], snapshot["vel"][i], snapshot["parent"][i],
+                           snapshot["radius"][i], snapshot["drag_area"][i], snapshot["minor"][i])
+        world.thrust[:world.count] = snapshot["thrust"]
+        world.atmospheres = snapshot["atmospheres"]
+        world.put_on_rails(np.flatnonzero(snapshot["rails"]))
+        return world
+
+def prediction_worker(requests, results, latest):
+    # Runs in its own process, so long predictions never touch the frame loop
+    while True:
+        job = requests.get()
+        if job is None:
+            return
+        request_id, snapshot, body, reference, horizon, levels = job
+        for level, points in enumerate(levels):
+            if latest.value != request_id:
+                break
+            world = PhysicsWorld.from_snapshot(snapshot)
+            # Accuracy comes from the refinement passes, so each pass uses the cheaper integrator
+            world.integrator = "leapfrog"
+            world.take_off_rails(body)
+            dt = horizon / points
+            track = np.empty((points + 1, 3))
+            track[0] = world.pos[body] - world.pos[reference]
+            for k in range(points):
+                # A newer request (e.g. the player changed thrust) makes this one stale
+                if k % 64 == 0 and latest.value != request_id:
+                    break
+                world.step(dt)
+                track[k + 1] = world.pos[body] - world.pos[reference]
+            else:
+                results.put((request_id, level, track))
+                continue
+            break
+
+class PredictionService:
+    def __init__(self, levels=(64, 256, 1024, 4096)):
+        self.levels = levels  # points per refinement pass, coarse first
+        # Spawned rather than forked, a fork could copy a lock held by the save writer or font preload thread
+        self.context = multiprocessing.get_context("spawn")
+        self.requests = None
+        self.results = None
+        self.latest = None
+        self.process = None
+        self.request_id = 0
+        self.level = -1
+        self.track = None
+        self.time = None
+
+    def start(self):
+        if self.process is not None:
+            return
+        self.requests = self.context.Queue()
+        self.results = self.context.Queue()
+        self.latest = self.context.Value("i", 0)
+        self.process = self.context.Process(target=prediction_worker, args=(self.requests, self.results, self.latest), daemon=True)
+        self.process.start()
+
+    def request(self, world, body, horizon, reference=None):
+        self.start()
+        if reference is None:
+            reference = max(world.parent[body], 0)
+        self.request_id += 1
+        self.latest.value = self.request_id
+        self.level = -1
+        self.time = world.time
+        # Minor bodies barely pull on a vessel, leaving them out keeps predictions as cheap as without a belt
+        rows = np.flatnonzero(~world.minor[:world.count])
+        index = np.full(world.count, -1)
+        index[rows] = np.arange(len(rows))
+        self.requests.put((self.request_id, world.snapshot(rows), index[body], index[reference], horizon, self.levels))
+        return self.request_id
+
+    def poll(self):
+        # Takes whatever is ready without waiting, returns True when a better track arrived
+        if self.process is None:
+            return False
+        changed = False
+        while True:
+            try:
+                request_id, level, track = self.results.get_nowait()
+            except queue.Empty:
+                return changed
+            if request_id == self.request_id and level > self.level:
+                self.level = level
+                self.track = track
+                changed = True
+
+    def stop(self):
+        if self.process is None:
+            return
+        self.latest.value = -1
+        self.requests.put(None)
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process = None
+
+class SimulationClock:
+    def __init__(self, dt=60.0, max_steps=240):
+        self.dt = dt  # simulated seconds per physics step, independent of the frame rate
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.warp = 1
+        self.warps = [1, 10, 100, 1000, 10000, 100000]
+
+    def change_warp(self, direction):
+        i = self.warps.index(self.warp) if self.warp in self.warps else 0
+        self.warp = self.warps[max(0, min(i + direction, len(self.warps) - 1))]
+
+    def update(self, real_dt):
+        # Returns how many fixed steps to run for this frame
+        self.accumulator += real_dt * self.warp
+        steps = int(self.accumulator // self.dt)
+        if steps > self.max_steps:
+            # Drop the backlog instead of letting the frame rate spiral down
+            steps = self.max_steps
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= steps * self.dt
+        return steps
+
+# name, mass (kg), parent, semi-major axis (m), radius (m)
+SOLAR_SYSTEM = [
+    ("Sun", 1.989e30, None, 0.0, 6.957e8),
+    ("Mercury", 3.301e23, "Sun", 5.791e10, 2.4397e6),
+    ("Venus", 4.867e24, "Sun", 1.0821e11, 6.0518e6),
+    ("Earth", 5.972e24, "Sun", 1.496e11, 6.371e6),
+    ("Luna", 7.342e22, "Earth", 3.844e8, 1.7374e6),
+    ("Mars", 6.417e23, "Sun", 2.2794e11, 3.3895e6),
+    ("Phobos", 1.0659e16, "Mars", 9.376e6, 1.1267e4),
+    ("Deimos", 1.4762e15, "Mars", 2.3463e7, 6.2e3),
+    ("Ceres", 9.3835e20, "Sun", 4.1394e11, 4.697e5),
+]
+
+BODY_COLORS = {
+    "Sun": (255, 210, 80),
+    "Mercury": (150, 140, 130),
+    "Venus": (220, 190, 130),
+    "Earth": (70, 120, 200),
+    "Luna": (180, 180, 180),
+    "Mars": (200, 90, 50),
+    "Phobos": (120, 100, 90),
+    "Deimos": (140, 120, 100),
+    "Ceres": (130, 130, 120),
+}
+
+def create_solar_system(on_rails=True):
+    world = PhysicsWorld(capacity=len(SOLAR_SYSTEM))
+    for i, (name, mass, parent, distance, radius) in enumerate(SOLAR_SYSTEM):
+        if parent is None:
+            world.add_body(name, mass, (0, 0, 0), (0, 0, 0), radius=radius)
+            continue
+        # Circular, coplanar orbits spread around the parent
+        p = world.index(parent)
+        angle = i * 2.4
+        direction = np.array([np.cos(angle), np.sin(angle), 0.0])
+        tangent = np.array([-np.sin(angle), np.cos(angle), 0.0])
+        speed = np.sqrt(G * (world.mass[p] + mass) / distance)
+        world.add_body(name, mass, world.pos[p] + direction * distance, world.vel[p] + tangent * speed, p, radius)
+    if on_rails:
+        # Patched conics: each body follows a fixed Kepler orbit around its parent
+        world.put_on_rails(np.arange(world.count))
+    else:
+        world.center_momentum()
+    return world
+
+ASTEROID_COUNT = 10000
+
+def create_asteroid_belt(world, count=ASTEROID_COUNT, seed=0, inner=2.1, outer=3.3, on_rails=True):
+    # Main belt between inner and outer AU, sizes follow N(>r) ~ r^-2 from 1 km up
+    rng = np.random.default_rng(seed)
+    sun = world.index("Sun")
+    distance = rng.uniform(inner, outer, count) * AU
+    angle = rng.uniform(0, 2 * np.pi, count)
+    inclination = np.abs(rng.normal(0, 0.1, count))
+    radius = np.minimum(1000.0 * rng.uniform(0, 1, count) ** -0.5, 250e3)
+    mass = 4 / 3 * np.pi * radius ** 3 * 2000.0
+    # Nearly circular orbits, tilted about the line to the sun
+    speed = np.sqrt(G * world.mass[sun] / distance) * rng.normal(1, 0.03, count)
+    radial = np.stack([np.cos(angle), np.sin(angle), np.zeros(count)], axis=1)
+    tangent = np.stack([-np.sin(angle), np.cos(angle), np.zeros(count)], axis=1)
+    tangent = tangent * np.cos(inclination)[:, None] + np.array([0.0, 0.0, 1.0]) * np.sin(inclination)[:, None]
+    if world.count + count > len(world.mass):
+        world.grow(world.count + count)
+    first = world.count
+    for k in range(count):
+        world.add_body(f"Asteroid {k + 1}", mass[k], world.pos[sun] + radial[k] * distance[k], world.vel[sun] + tangent[k] * speed[k],
+                       sun, radius[k], minor=True)
+    rows = np.arange(first, world.count)
+    if on_rails:
+        world.put_on_rails(rows)
+    return rows
+
+def body_colors(names):
+    # Known bodies use their table color, anything else gets a stable color from its name
+    colors = []
+    for name in names:
+        color = BODY_COLORS.get(name)
+        if color is None:
+            h = zlib.crc32(name.encode("utf-8"))
+            color = (90 + h % 130, 90 + (h >> 8) % 130, 90 + (h >> 16) % 130)
+        colors.append(color)
+    return np.array(colors, dtype=np.uint8).reshape(-1, 3)
+
+# name, surface pressure (Pa), surface temperature (K), molar mass (kg/mol), heat capacity ratio, top (m),
+# layers of (base altitude (m), lapse rate (K/m))
+ATMOSPHERES = [
+    ("Venus", 9.2e6, 737.0, 0.04345, 1.29, 250e3, [(0.0, -0.0077), (65e3, -0.0021), (100e3, 0.0)]),
+    ("Earth", 101325.0, 288.15, 0.0289644, 1.4, 140e3, [(0.0, -0.0065), (11e3, 0.0), (20e3, 0.001), (32e3, 0.0028),
+                                                        (47e3, 0.0), (51e3, -0.0028), (71e3, -0.002), (84.852e3, 0.0)]),
+    ("Mars", 699.0, 242.15, 0.04334, 1.29, 120e3, [(0.0, -0.000998), (7e3, -0.00222), (50e3, 0.0)]),
+]
+
+# Drag coefficient of a blunt body against Mach number, with the transonic rise
+DRAG_MACH = np.array([0.0, 0.6, 0.8, 1.0, 1.2, 1.5, 2.0, 3.0, 5.0, 10.0])
+DRAG_CD = np.array([0.5, 0.5, 0.55, 0.85, 1.0, 0.98, 0.92, 0.88, 0.86, 0.85])
+
+class Atmosphere:
+    def __init__(self, name, gm, radius, surface_pressure, surface_temperature, molar_mass, gamma, top, layers,
+                 samples=4096, cache_dir=None):
+        self.name = name
+        self.top = top
+        self.altitude = np.linspace(0.0, top, samples)
+        self.params = [name, gm, radius, surface_pressure, surface_temperature, molar_mass, gamma, top, layers, samples]
+        table = None
+        if cache_dir is not None:
+            path = os.path.join(cache_dir, f"{name}-{self.key()}.npy")
+            try:
+                table = np.load(path)
+            except (OSError, ValueError):
+                table = None
+        if table is None or table.shape != (4, samples):
+            table = self.build()
+            if cache_dir is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                np.save(path, table)
+        # Log density and pressure interpolate almost exactly between samples of an exponential falloff
+        self.log_density, self.log_pressure, self.temperature, self.sound_speed = table
+
+    def key(self):
+        # Cache files are named after the body parameters, so changing any of them builds a new table
+        return f"{zlib.crc32(json.dumps(self.params).encode('utf-8')):08x}"
+
+    def build(self, oversample=16):
+        name, gm, radius, surface_pressure, surface_temperature, molar_mass, gamma, top, layers, samples = self.params
+        h = np.linspace(0.0, top, (samples - 1) * oversample + 1)
+        temperature = np.full_like(h, surface_temperature)
+        bases = [base for base, lapse in layers] + [np.inf]
+        for (base, lapse), end in zip(layers, bases[1:]):
+            # Each layer continues from the temperature the one below ended at
+            temperature[h > base] += lapse * (np.minimum(h[h > base], end) - base)
+        temperature = np.maximum(temperature, 1.0)
+        # Hydrostatic balance with gravity falling off over altitude: d ln p / dh = -M g(h) / (R T(h))
+        slope = -molar_mass * gm / (radius + h) ** 2 / (GAS_CONSTANT * temperature)
+        log_pressure = np.log(surface_pressure) + np.concatenate(([0.0], np.cumsum((slope[1:] + slope[:-1]) / 2 * np.diff(h))))
+        log_density = log_pressure + np.log(molar_mass / (GAS_CONSTANT * temperature))
+        sound_speed = np.sqrt(gamma * GAS_CONSTANT * temperature / molar_mass)
+        return np.stack([log_density, log_pressure, temperature, sound_speed])[:, ::oversample]
+
+    def sample(self, altitude):
+        # Density, pressure and temperature for any number of altitudes, there is no air above the top
+        altitude = np.asarray(altitude, dtype=float)
+        density = np.exp(np.interp(altitude, self.altitude, self.log_density, right=-np.inf))
+        pressure = np.exp(np.interp(altitude, self.altitude, self.log_pressure, right=-np.inf))
+        return density, pressure, np.interp(altitude, self.altitude, self.temperature)
+
+    def drag_rate(self, altitude, velocity, area):
+        # Drag deceleration over speed (1/s) for bodies moving at velocity relative to the air, area is reference area per kilogram
+        density = np.exp(np.interp(altitude, self.altitude, self.log_density, right=-np.inf))
+        speed = np.sqrt(np.einsum("ij,ij->i", velocity, velocity))
+        mach = speed / np.interp(altitude, self.altitude, self.sound_speed)
+        return 0.5 * density * np.interp(mach, DRAG_MACH, DRAG_CD) * area * speed
+
+def create_atmospheres(world, cache_dir=None):
+    atmospheres = {}
+    for name, *params in ATMOSPHERES:
+        if name in world.names:
+            i = world.index(name)
+            atmospheres[i] = Atmosphere(name, world.gm[i], world.radius[i], *params, cache_dir=cache_dir)
+    return atmospheres
+
+class CelestialRenderer:
+    def __init__(self, max_bytes=32 * 1024 * 1024, sprite_limit=256):
+        self.sprites = OrderedDict()
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.sprite_limit = sprite_limit  # screen radius above which discs are drawn directly instead of cached
+        self.stats = {"points": 0, "icons": 0, "sprites": 0, "discs": 0}
+        # Pixel offsets for the small icon discs
+        self.stencils = {}
+        for radius in (1, 2, 3):
+            r = np.arange(-radius, radius + 1)
+            dx, dy = np.meshgrid(r, r, indexing="ij")
+            inside = dx ** 2 + dy ** 2 <= radius ** 2 + radius
+            self.stencils[radius] = (dx[inside], dy[inside])
+
+    def sprite(self, color, bucket):
+        # Quarter-octave zoom buckets, so a sprite is reused while the on-screen size changes by under 10%
+        key = (color, bucket)
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.sprites.move_to_end(key)
+            return sprite
+
+        radius = 2 ** (bucket / 4)
+        size = int(np.ceil(radius)) * 2 + 2
+        c = (size - 1) / 2
+        x, y = np.meshgrid(np.arange(size) - c, np.arange(size) - c, indexing="ij")
+        d = np.hypot(x, y) / radius
+        # Limb darkening plus a light from the upper left
+        shade = np.sqrt(np.clip(1 - d ** 2, 0, 1)) * 0.6 + np.clip(-(x + y) / (radius * 2.8), 0, 1) * 0.25 + 0.3
+        sprite = pygame.Surface((size, size), pygame.SRCALPHA)
+        rgb = pygame.surfarray.pixels3d(sprite)
+        rgb[:] = np.clip(np.array(color)[None, None, :] * shade[..., None], 0, 255).astype(np.uint8)
+        del rgb
+        alpha = pygame.surfarray.pixels_alpha(sprite)
+        alpha[:] = (np.clip((1 - d) * radius + 0.5, 0, 1) * 255).astype(np.uint8)
+        del alpha
+
+        self.sprites[key] = sprite
+        self.bytes += size * size * 4
+        while self.bytes > self.max_bytes:
+            _, old = self.sprites.popitem(last=False)
+            self.bytes -= old.get_width() * old.get_height() * 4
+        return sprite
+
+    def draw(self, surface, positions, radii, colors, center, view_scale):
+        # positions and radii in meters, view_scale in meters per pixel, center lands in the middle of the surface
+        width, height = surface.get_size()
+        x = (positions[:, 0] - center[0]) / view_scale + width / 2
+        y = (positions[:, 1] - center[1]) / view_scale + height / 2
+        r = radii / view_scale
+
+        # Bulk cull against the viewport before any per-body work
+        visible = (x + r >= 0) & (x - r < width) & (y + r >= 0) & (y - r < height)
+        rows = np.flatnonzero(visible)
+        x, y, r = x[rows], y[rows], r[rows]
+        colors = colors[rows]
+
+        points = r < 1
+        icons = (r >= 1) & (r < 4)
+        sprites = (r >= 4) & (r < self.sprite_limit)
+        discs = r >= self.sprite_limit
+        self.stats = {"points": int(points.sum()), "icons": int(icons.sum()), "sprites": int(sprites.sum()), "discs": int(discs.sum())}
+
+        # Largest first so moons stay on top of their planets
+        diagonal = np.hypot(width, height)
+        for i in np.flatnonzero(discs)[np.argsort(-r[discs])]:
+            color = tuple(int(c) for c in colors[i])
+            if r[i] < 4 * diagonal:
+                pygame.draw.circle(surface, color, (x[i], y[i]), r[i])
+                pygame.draw.circle(surface, tuple(int(c * 0.7) for c in color), (x[i], y[i]), r[i], 2)
+            else:
+                self.draw_horizon(surface, color, x[i], y[i], r[i], diagonal)
+
+        order = np.flatnonzero(sprites)[np.argsort(-r[sprites])]
+        buckets = np.round(np.log2(r[order]) * 4).astype(int)
+        blits = []
+        for i, bucket in zip(order, buckets):
+            sprite = self.sprite(tuple(int(c) for c in colors[i]), int(bucket))
+            half = sprite.get_width() / 2
+            blits.append((sprite, (x[i] - half, y[i] - half)))
+        surface.blits(blits, doreturn=False)
+
+        if points.any() or icons.any():
+            pixels = pygame.surfarray.pixels3d(surface)
+            xi, yi = x.astype(np.int64), y.astype(np.int64)
+            self.plot(pixels, xi[points], yi[points], colors[points])
+            radius = np.clip(np.round(r), 1, 3).astype(int)
+            for size, (dx, dy) in self.stencils.items():
+                chosen = icons & (radius == size)
+                for ox, oy in zip(dx, dy):
+                    self.plot(pixels, xi[chosen] + ox, yi[chosen] + oy, colors[chosen])
+            del pixels
+
+    def plot(self, pixels, x, y, colors):
+        inside = (x >= 0) & (x < pixels.shape[0]) & (y >= 0) & (y < pixels.shape[1])
+        pixels[x[inside], y[inside]] = colors[inside]
+
+    def draw_horizon(self, surface, color, x, y, r, diagonal):
+        # Zoomed onto a surface the disc is far bigger than the screen, only the arc facing the screen is drawn
+        width, height = surface.get_size()
+        toward = np.arctan2(height / 2 - y, width / 2 - x)
+        span = min(np.pi, 2 * diagonal / r)
+        angles = np.linspace(toward - span, toward + span, 64)
+        arc = np.stack([x + r * np.cos(angles), y + r * np.sin(angles)], axis=1)
+        inward = -np.array([np.cos(toward), np.sin(toward)]) * 2 * diagonal
+        polygon = np.concatenate([arc, [arc[-1] + inward, arc[0] + inward]])
+        pygame.draw.polygon(surface, color, polygon.tolist())
+
+G0 = 9.80665
+
+def second_moments(masses, positions):
+    # Sum of m (|r|^2 I - r r^T), the inertia tensor of point masses about the vessel origin
+    r2 = np.einsum("ni,ni->n", positions, positions)
+    outer = np.einsum("n,ni,nj->nij", masses, positions, positions)
+    return masses[:, None, None] * r2[:, None, None] * np.eye(3) - outer
+
+class Vessel:
+    def __init__(self, capacity=64):
+        self.count = 0  # rows in use, removed rows go on the free list
+        self.free = []
+        self.names = [None] * capacity
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.dry_mass = np.zeros(capacity)
+        self.fuel = np.zeros(capacity)  # at a group fill level of 1, the real amount is fuel * level[group]
+        self.pos = np.zeros((capacity, 3))  # relative to the vessel origin
+        self.thrust = np.zeros((capacity, 3))  # full throttle thrust vector in newtons
+        self.isp = np.zeros(capacity)
+        self.decouple_stage = np.full(capacity, -1)
+        self.group = np.zeros(capacity, dtype=int)
+        # Tree links, so attaching and detaching never scan the part list
+        self.parent = np.full(capacity, -1)
+        self.first_child = np.full(capacity, -1)
+        self.next_sibling = np.full(capacity, -1)
+        self.prev_sibling = np.full(capacity, -1)
+        # Staging groups: 0 is the core that is never dropped, group k + 1 falls off with the stage k decouplers
+        self.level = np.ones(1)
+        self.group_dry = np.zeros(1)
+        self.group_dry_moment = np.zeros((1, 3))
+        self.group_dry_second = np.zeros((1, 3, 3))
+        self.group_fuel = np.zeros(1)
+        self.group_fuel_moment = np.zeros((1, 3))
+        self.group_fuel_second = np.zeros((1, 3, 3))
+        self.group_thrust = np.zeros((1, 3))
+        self.group_force = np.zeros(1)  # sum of thrust magnitudes
+        self.group_flow = np.zeros(1)  # propellant mass flow at full throttle, kg/s
+
+    def grow(self, capacity):
+        for name in ["alive", "dry_mass", "fuel", "pos", "thrust", "isp", "decouple_stage", "group",
+                     "parent", "first_child", "next_sibling", "prev_sibling"]:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        self.names += [None] * (capacity - len(self.names))
+
+    def grow_groups(self, groups):
+        for name in ["group_dry", "group_dry_moment", "group_dry_second", "group_fuel", "group_fuel_moment",
+                     "group_fuel_second", "group_thrust", "group_force", "group_flow"]:
+            old = getattr(self, name)
+            new = np.zeros((groups,) + old.shape[1:])
+            new[:len(old)] = old
+            setattr(self, name, new)
+        self.level = np.concatenate([self.level, np.ones(groups - len(self.level))])
+
+    def add_part(self, name, dry_mass, position, parent=-1, fuel=0.0, thrust=(0, 0, 0), isp=0.0, decouple_stage=-1):
+        if self.free:
+            i = self.free.pop()
+        else:
+            if self.count == len(self.alive):
+                self.grow(len(self.alive) * 2)
+            i = self.count
+            self.count += 1
+        group = decouple_stage + 1 if decouple_stage >= 0 else (self.group[parent] if parent >= 0 else 0)
+        if group >= len(self.level):
+            self.grow_groups(group + 1)
+
+        if self.level[group] != 1:
+            self.settle_level(group)
+
+        self.names[i] = name
+        self.alive[i] = True
+        self.dry_mass[i] = dry_mass
+        # Stored at a fill level of 1 so the group's later draining applies to it too
+        self.fuel[i] = fuel
+        self.pos[i] = position
+        self.thrust[i] = thrust
+        self.isp[i] = isp
+        self.decouple_stage[i] = decouple_stage
+        self.group[i] = group
+        self.parent[i] = parent
+        self.first_child[i] = -1
+        self.prev_sibling[i] = -1
+        self.next_sibling[i] = self.first_child[parent] if parent >= 0 else -1
+        if parent >= 0:
+            if self.first_child[parent] >= 0:
+                self.prev_sibling[self.first_child[parent]] = i
+            self.first_child[parent] = i
+        self.accumulate(np.array([i]), 1)
+        return i
+
+    def settle_level(self, group):
+        # Folds the group's fill level into its parts' fuel and resets it to 1, a drained group ends up with empty tanks
+        level = self.level[group]
+        rows = np.flatnonzero(self.alive[:self.count] & (self.group[:self.count] == group))
+        self.fuel[rows] *= level
+        self.group_fuel[group] *= level
+        self.group_fuel_moment[group] *= level
+        self.group_fuel_second[group] *= level
+        self.level[group] = 1.0
+
+    def accumulate(self, rows, sign):
+        # Adds (sign 1) or subtracts (sign -1) the rows' contributions to their groups' sums
+        groups = self.group[rows]
+        size = len(self.level)
+        pos = self.pos[rows]
+        thrust = np.linalg.norm(self.thrust[rows], axis=1)
+        flow = np.divide(thrust, self.isp[rows] * G0, out=np.zeros_like(thrust), where=self.isp[rows] > 0)
+        for total, values in ((self.group_dry, self.dry_mass[rows]), (self.group_fuel, self.fuel[rows]),
+                              (self.group_force, thrust), (self.group_flow, flow)):
+            total += sign * np.bincount(groups, weights=values, minlength=size)
+        for moment, second, masses in ((self.group_dry_moment, self.group_dry_second, self.dry_mass[rows]),
+                                       (self.group_fuel_moment, self.group_fuel_second, self.fuel[rows])):
+            np.add.at(moment, groups, sign * masses[:, None] * pos)
+            np.add.at(second, groups, sign * second_moments(masses, pos))
+        np.add.at(self.group_thrust, groups, sign * self.thrust[rows])
+
+    def subtree(self, i):
+        # Parents come before their children
+        rows = []
+        stack = [i]
+        while stack:
+            row = stack.pop()
+            rows.append(row)
+            child = self.first_child[row]
+            while child >= 0:
+                stack.append(child)
+                child = self.next_sibling[child]
+        return np.array(rows, dtype=int)
+
+    def detach(self, i):
+        parent = self.parent[i]
+        if parent >= 0:
+            if self.prev_sibling[i] >= 0:
+                self.next_sibling[self.prev_sibling[i]] = self.next_sibling[i]
+            else:
+                self.first_child[parent] = self.next_sibling[i]
+            if self.next_sibling[i] >= 0:
+                self.prev_sibling[self.next_sibling[i]] = self.prev_sibling[i]
+        self.parent[i] = -1
+        self.prev_sibling[i] = self.next_sibling[i] = -1
+
+    def remove_part(self, i):
+        # Removes the part and everything attached below it
+        rows = self.subtree(i)
+        self.detach(i)
+        self.accumulate(rows, -1)
+        self.alive[rows] = False
+        self.free.extend(rows.tolist())
+        return rows
+
+    def split(self, i):
+        # Moves the subtree under i into a new vessel, keeping the parts' positions
+        rows = self.subtree(i)
+        debris = Vessel(capacity=max(len(rows), 1))
+        new_index = {}
+        for row in rows:
+            parent = new_index.get(self.parent[row], -1) if row != i else -1
+            new_index[row] = debris.add_part(self.names[row], self.dry_mass[row], self.pos[row], parent,
+                                             self.fuel[row] * self.level[self.group[row]], self.thrust[row],
+                                             self.isp[row], self.decouple_stage[row])
+        self.remove_part(i)
+        return debris
+
+    def drain(self, i, amount):
+        # Takes fuel from one part, returns how much was actually there
+        group = self.group[i]
+        amount = min(amount, self.fuel[i] * self.level[group])
+        removed = amount / self.level[group] if self.level[group] > 0 else 0.0
+        self.fuel[i] -= removed
+        self.group_fuel[group] -= removed
+        self.group_fuel_moment[group] -= removed * self.pos[i]
+        self.group_fuel_second[group] -= second_moments(np.array([removed]), self.pos[i:i + 1])[0]
+        return amount
+
+    def burning_group(self):
+        # The outermost group that is still attached
+        attached = np.flatnonzero((self.group_dry > 1e-6) | (self.group_fuel > 1e-6))
+        return int(attached.max()) if len(attached) else 0
+
+    def burn(self, dt, throttle=1.0):
+        # Engines of the burning group drain that group's tanks evenly, which only rescales the group's fill level
+        group = self.burning_group()
+        fuel = self.group_fuel[group] * self.level[group]
+        used = min(self.group_flow[group] * throttle * dt, fuel)
+        if fuel <= 0 or used <= 0:
+            return np.zeros(3)
+        self.level[group] *= 1 - used / fuel
+        return self.group_thrust[group] * throttle * (used / (self.group_flow[group] * throttle * dt))
+
+    def stage(self):
+        # Fires the decouplers of the burning group, returns the separated parts as new vessels
+        group = self.burning_group()
+        if group == 0:
+            return []
+        roots = np.flatnonzero(self.alive[:self.count] & (self.decouple_stage[:self.count] == group - 1))
+        # A decoupler nested under an earlier one has already left with it
+        return [self.split(i) for i in roots if self.alive[i]]
+
+    @property
+    def mass(self):
+        return float(self.group_dry.sum() + self.group_fuel @ self.level)
+
+    def moments(self):
+        mass = self.mass
+        moment = self.group_dry_moment.sum(axis=0) + self.level @ self.group_fuel_moment
+        second = self.group_dry_second.sum(axis=0) + np.einsum("g,gij->ij", self.level, self.group_fuel_second)
+        return mass, moment, second
+
+    @property
+    def center_of_mass(self):
+        mass, moment, second = self.moments()
+        return moment / mass if mass > 0 else np.zeros(3)
+
+    @property
+    def inertia(self):
+        # Parallel axis theorem moves the origin tensor to the center of mass
+        mass, moment, second = self.moments()
+        if mass <= 0:
+            return np.zeros((3, 3))
+        c = moment / mass
+        return second - mass * (c @ c * np.eye(3) - np.outer(c, c))
+
+    @property
+    def max_thrust(self):
+        return self.group_thrust[self.burning_group()].copy()
+
+    def delta_v(self):
+        # Per stage, from the stage burning now down to the core, engines only burn their own group's tanks
+        masses = self.group_dry + self.group_fuel * self.level
+        fuel = self.group_fuel * self.level
+        start = np.cumsum(masses)  # group g burns while groups 0..g are attached
+        end = start - fuel
+        isp = np.divide(self.group_force, self.group_flow * G0, out=np.zeros_like(self.group_force), where=self.group_flow > 0)
+        dv = np.where((end > 0) & (fuel > 0), isp * G0 * np.log(np.divide(start, end, out=np.ones_like(start), where=end > 0)), 0.0)
+        return dv[:self.burning_group() + 1][::-1]
+
+LIGHT_YEAR = 9.4607e15
+AU = 1.496e11
+PARSEC = 3.0857e16
+SUN_MASS = 1.989e30
+EARTH_MASS = 5.972e24
+
+def sector_seed(seed, coords):
+    # Stable across runs and platforms, unlike hash()
+    key = f"{seed}:{coords[0]}:{coords[1]}:{coords[2]}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+class Sector:
+    def __init__(self, coords, stars, planets):
+        self.coords = coords
+        self.stars = stars  # dict of arrays, one row per star
+        self.planets = planets  # dict of arrays, "star" holds the row of the parent star
+
+    def nbytes(self):
+        return sum(a.nbytes for a in self.stars.values()) + sum(a.nbytes for a in self.planets.values())
+
+def generate_sector(seed, coords, size=20.0, density=0.004):
+    # Every sector has its own RNG stream, so generation order never changes the result
+    rng = np.random.default_rng(sector_seed(seed, coords))
+    count = rng.poisson(density * size ** 3)
+    origin = np.array(coords, dtype=float) * size
+    mass = np.clip(np.exp(rng.normal(np.log(0.3), 0.8, count)), 0.08, 60.0)
+    stars = {
+        "position": origin + rng.random((count, 3)) * size,  # light-years
+        "mass": mass,  # solar masses
+        "luminosity": mass ** 3.5,  # solar luminosities
+        "temperature": 5772.0 * mass ** 0.505,  # kelvin
+    }
+    planet_counts = rng.poisson(2.5, count)
+    total = int(planet_counts.sum())
+    planets = {
+        "star": np.repeat(np.arange(count), planet_counts),
+        "semi_major_axis": np.exp(rng.uniform(np.log(0.05), np.log(50.0), total)),  # AU
+        "mass": np.exp(rng.uniform(np.log(0.05), np.log(3000.0), total)),  # Earth masses
+        "eccentricity": rng.beta(0.867, 3.03, total),
+        "phase": rng.uniform(0, 2 * np.pi, total),
+    }
+    return Sector(tuple(coords), stars, planets)
+
+class Universe:
+    def __init__(self, seed, sector_size=20.0, load_radius=1, max_sectors=125, prefetch=True):
+        self.seed = seed
+        self.sector_size = sector_size  # light-years
+        self.load_radius = load_radius  # sectors kept around the player
+        self.max_sectors = max_sectors
+        self.sectors = OrderedDict()
+        self.lock = threading.Lock()
+        self.center = None
+        self.prefetch = prefetch
+        self.jobs = queue.Queue()
+        self.thread = None
+
+    def sector_of(self, position):
+        return tuple(int(c) for c in np.floor(np.asarray(position, dtype=float) / self.sector_size))
+
+    def get(self, coords):
+        coords = tuple(coords)
+        with self.lock:
+            sector = self.sectors.get(coords)
+            if sector is not None:
+                self.sectors.move_to_end(coords)
+                return sector
+        sector = generate_sector(self.seed, coords, self.sector_size)
+        self.store(sector)
+        return sector
+
+    def store(self, sector):
+        with self.lock:
+            self.sectors[sector.coords] = sector
+            self.sectors.move_to_end(sector.coords)
+            while len(self.sectors) > self.max_sectors:
+                self.sectors.popitem(last=False)
+
+    def neighbours(self, coords, radius):
+        r = range(-radius, radius + 1)
+        return [(coords[0] + x, coords[1] + y, coords[2] + z) for x in r for y in r for z in r]
+
+    def update(self, position):
+        # Call every frame, it only does work when the player crosses into another sector
+        center = self.sector_of(position)
+        if center == self.center:
+            return self.get(center)
+        self.center = center
+        sector = self.get(center)
+        with self.lock:
+            for coords in list(self.sectors):
+                if max(abs(a - b) for a, b in zip(coords, center)) > self.load_radius + 1:
+                    del self.sectors[coords]
+        if self.prefetch:
+            self.start()
+            for coords in self.neighbours(center, self.load_radius):
+                self.jobs.put(coords)
+        return sector
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+
+    def worker(self):
+        while True:
+            coords = self.jobs.get()
+            # Skip work that went stale while it sat in the queue
+            if self.center is None or max(abs(a - b) for a, b in zip(coords, self.center)) > self.load_radius:
+                continue
+            with self.lock:
+                if coords in self.sectors:
+                    continue
+            self.store(generate_sector(self.seed, coords, self.sector_size))
+
+    def stars_near(self, position, radius):
+        # Positions and rows of stars within radius light-years, generating sectors as needed
+        position = np.asarray(position, dtype=float)
+        reach = int(np.ceil(radius / self.sector_size))
+        found = []
+        for coords in self.neighbours(self.sector_of(position), reach):
+            sector = self.get(coords)
+            d = np.linalg.norm(sector.stars["position"] - position, axis=1)
+            for row in np.flatnonzero(d <= radius):
+                found.append((d[row], coords, row))
+        found.sort()
+        return found
+
+EXOPLANET_DTYPE = np.dtype([
+    ("name", "S48"),
+    ("host", "S48"),
+    ("distance", "f8"),  # parsecs
+    ("mass", "f8"),  # Earth masses
+    ("radius", "f8"),  # Earth radii
+    ("period", "f8"),  # days
+    ("semi_major_axis", "f8"),  # AU
+    ("star_mass", "f8"),  # solar masses
+    ("x", "f8"),  # parsecs, equatorial cartesian
+    ("y", "f8"),
+    ("z", "f8"),
+])
+
+# NASA Exoplanet Archive (PSCompPars) column for each catalog field
+EXOPLANET_COLUMNS = {
+    "name": "pl_name",
+    "host": "hostname",
+    "distance": "sy_dist",
+    "mass": "pl_bmasse",
+    "radius": "pl_rade",
+    "period": "pl_orbper",
+    "semi_major_axis": "pl_orbsmax",
+    "star_mass": "st_mass",
+}
+
+def build_exoplanet_catalog(csv_path, cache_dir, cell_size=10.0):
+    # One-off conversion of the archive CSV into .npy columns that can be memory-mapped
+    rows = []
+    with open(csv_path, 'r', newline='', encoding="utf-8") as file:
+        reader = csv.DictReader(line for line in file if not line.startswith("#"))
+        for record in reader:
+            row = []
+            for field in EXOPLANET_DTYPE.names[:8]:
+                value = record.get(EXOPLANET_COLUMNS[field], "")
+                if field in ("name", "host"):
+                    row.append(value.strip().encode("utf-8")[:48])
+                else:
+                    try:
+                        row.append(float(value))
+                    except ValueError:
+                        row.append(math.nan)
+            ra, dec = record.get("ra", ""), record.get("dec", "")
+            try:
+                ra, dec = math.radians(float(ra)), math.radians(float(dec))
+                d = row[2]
+                row += [d * math.cos(dec) * math.cos(ra), d * math.cos(dec) * math.sin(ra), d * math.sin(dec)]
+            except ValueError:
+                row += [math.nan, math.nan, math.nan]
+            rows.append(tuple(row))
+    catalog = np.array(rows, dtype=EXOPLANET_DTYPE)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(os.path.join(cache_dir, "catalog.npy"), catalog)
+    # Sorted copies of each key column plus the row order, so range queries are a searchsorted away
+    for field in ("name", "distance", "mass", "radius"):
+        order = np.argsort(catalog[field], kind="stable")
+        np.save(os.path.join(cache_dir, f"{field}_order.npy"), order)
+        np.save(os.path.join(cache_dir, f"{field}_sorted.npy"), catalog[field][order])
+
+    # Host stars bucketed into a uniform grid for nearest-star lookups
+    hosts, first = np.unique(catalog["host"], return_index=True)
+    host_pos = np.stack([catalog["x"][first], catalog["y"][first], catalog["z"][first]], axis=1)
+    known = np.all(np.isfinite(host_pos), axis=1)
+    hosts, host_pos = hosts[known], host_pos[known]
+    cells = np.floor(host_pos / cell_size).astype(np.int64)
+    keys = cell_keys(cells)
+    order = np.argsort(keys, kind="stable")
+    np.save(os.path.join(cache_dir, "host_names.npy"), hosts[order])
+    np.save(os.path.join(cache_dir, "host_positions.npy"), host_pos[order])
+    np.save(os.path.join(cache_dir, "host_keys.npy"), keys[order])
+
+    stat = os.stat(csv_path)
+    with open(os.path.join(cache_dir, "meta.json"), 'w') as file:
+        json.dump({"source_mtime": stat.st_mtime, "source_size": stat.st_size, "cell_size": cell_size, "count": len(catalog)}, file)
+
+def cell_keys(cells):
+    # Packs signed 21-bit cell coordinates into one sortable int64
+    offset = cells + (1 << 20)
+    return (offset[..., 0] << 42) | (offset[..., 1] << 21) | offset[..., 2]
+
+class ExoplanetCatalog:
+    def __init__(self, cache_dir):
+        with open(os.path.join(cache_dir, "meta.json"), 'r') as file:
+            self.meta = json.load(file)
+        self.cell_size = self.meta["cell_size"]
+
+        def load(name):
+            return np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r")
+
+        self.planets = load("catalog")
+        self.order = {field: load(f"{field}_order") for field in ("name", "distance", "mass", "radius")}
+        self.sorted = {field: load(f"{field}_sorted") for field in ("name", "distance", "mass", "radius")}
+        self.host_names = load("host_names")
+        self.host_positions = load("host_positions")
+        self.host_keys = load("host_keys")
+
+    @classmethod
+    def open(cls, csv_path=os.path.join("data", "exoplanets.csv"), cache_dir=os.path.join("data", "exoplanets")):
+        # Rebuilds the binary cache only when the CSV changed, returns None when there is no catalog at all
+        meta_path = os.path.join(cache_dir, "meta.json")
+        if os.path.exists(csv_path):
+            stat = os.stat(csv_path)
+            try:
+                with open(meta_path, 'r') as file:
+                    meta = json.load(file)
+                stale = meta["source_mtime"] != stat.st_mtime or meta["source_size"] != stat.st_size
+            except (OSError, ValueError, KeyError):
+                stale = True
+            if stale:
+                build_exoplanet_catalog(csv_path, cache_dir)
+        elif not os.path.exists(meta_path):
+            return None
+        return cls(cache_dir)
+
+    def __len__(self):
+        return len(self.planets)
+
+    def find(self, name):
+        key = name.encode("utf-8")
+        names = self.sorted["name"]
+        i = np.searchsorted(names, key)
+        if i < len(names) and names[i] == key:
+            return self.planets[self.order["name"][i]]
+        return None
+
+    def search(self, prefix):
+        key = prefix.encode("utf-8")
+        lo = np.searchsorted(self.sorted["name"], key, side="left")
+        hi = np.searchsorted(self.sorted["name"], key + b"\xff", side="left")
+        return self.planets[np.sort(self.order["name"][lo:hi])]
+
+    def between(self, field, low=-np.inf, high=np.inf):
+        # Rows whose field is in [low, high], e.g. between("mass", 0.5, 2) for Earth-like masses
+        values = self.sorted[field]
+        lo = np.searchsorted(values, low, side="left")
+        hi = np.searchsorted(values, high, side="right")
+        return self.planets[np.sort(self.order[field][lo:hi])]
+
+    def nearest(self, field="distance", count=10):
+        return self.planets[self.order[field][:count]]
+
+    def nearest_host(self, position, max_radius=4):
+        # Searches grid shells outward until no closer star can exist, far from every star it scans them all
+        position = np.asarray(position, dtype=float)
+        if not len(self.host_keys):
+            return None, np.inf
+        center = np.floor(position / self.cell_size).astype(np.int64)
+        best, best_d = None, np.inf
+        for radius in range(max_radius + 1):
+            if best_d <= (radius - 1) * self.cell_size:
+                break
+            r = np.arange(-radius, radius + 1)
+            shell = np.stack(np.meshgrid(r, r, r, indexing="ij"), axis=-1).reshape(-1, 3)
+            shell = shell[np.max(np.abs(shell), axis=1) == radius]
+            keys = cell_keys(center + shell)
+            starts = np.searchsorted(self.host_keys, keys, side="left")
+            ends = np.searchsorted(self.host_keys, keys, side="right")
+            for start, end in zip(starts, ends):
+                if start == end:
+                    continue
+                d = np.linalg.norm(self.host_positions[start:end] - position, axis=1)
+                i = np.argmin(d)
+                if d[i] < best_d:
+                    best, best_d = start + i, d[i]
+        else:
+            if best is None or best_d > max_radius * self.cell_size:
+                d = np.linalg.norm(self.host_positions - position, axis=1)
+                best = np.argmin(d)
+                best_d = d[best]
+        return self.host_names[best].decode("utf-8"), float(best_d)
+
+def parse_seed(seed):
+    seed = str(seed).strip()
+    if seed.isdigit():
+        return int(seed)
+    return zlib.crc32(seed.encode("utf-8"))
+
+def lu_factor(W):
+    # Batched LU with partial pivoting, laid out (n, n, batch) so every elimination step runs over the whole batch
+    lu = np.ascontiguousarray(np.transpose(W, (1, 2, 0)))
+    n = len(lu)
+    pivots = np.empty((n, lu.shape[2]), dtype=np.intp)
+    for j in range(n):
+        pivot = j + np.argmax(np.abs(lu[j:, j]), axis=0)
+        pivots[j] = pivot
+        for i in range(j + 1, n):
+            swap = np.flatnonzero(pivot == i)
+            if len(swap):
+                rows = lu[j][:, swap]
+                lu[j][:, swap] = lu[i][:, swap]
+                lu[i][:, swap] = rows
+        lu[j + 1:, j] /= lu[j, j]
+        lu[j + 1:, j + 1:] -= lu[j + 1:, j, None] * lu[j, None, j + 1:]
+    return lu, pivots
+
+def lu_solve(lu, pivots, b):
+    # Solves every system of the batch for the (batch, n) right-hand sides b
+    x = np.array(b.T)
+    n = len(x)
+    for j in range(n):
+        for i in range(j + 1, n):
+            swap = np.flatnonzero(pivots[j] == i)
+            if len(swap):
+                x[j, swap], x[i, swap] = x[i, swap], x[j, swap]
+    for j in range(n):
+        x[j + 1:] -= lu[j + 1:, j] * x[j]
+    for j in range(n - 1, -1, -1):
+        x[j] /= lu[j, j]
+        x[:j] -= lu[:j, j] * x[j]
+    return x.T
+
+ROS2_GAMMA = 1 + 1 / np.sqrt(2)
+
+class ReactionNetwork:
+    def __init__(self):
+        self.species = []
+        self.reactions = []  # name, reactants, products, pre-exponential factor, activation energy, orders
+        self.built = False
+
+    def add_reaction(self, name, reactants, products, A, Ea=0.0, orders=None):
+        for species in (*reactants, *products):
+            if species not in self.species:
+                self.species.append(species)
+        # Mass action by default, global reactions can pass empirical orders
+        self.reactions.append((name, reactants, products, A, Ea, orders or reactants))
+        self.built = False
+
+    def build(self):
+        # Net stoichiometry as a reactions x species matrix, rate laws as padded reactant slots per reaction
+        # so rates cost (reactions x reactants) instead of (reactions x species) per vessel
+        self.stoichiometry = np.zeros((len(self.reactions), len(self.species)))
+        slots = max((len(reaction[5]) for reaction in self.reactions), default=1)
+        self.slot_species = np.full((len(self.reactions), slots), len(self.species))  # padding reads a column of ones
+        self.slot_orders = np.zeros((len(self.reactions), slots))
+        for j, (name, reactants, products, A, Ea, orders) in enumerate(self.reactions):
+            for s, (species, n) in enumerate(orders.items()):
+                self.slot_species[j, s] = self.species.index(species)
+                self.slot_orders[j, s] = n
+            for species, n in reactants.items():
+                self.stoichiometry[j, self.species.index(species)] -= n
+            for species, n in products.items():
+                self.stoichiometry[j, self.species.index(species)] += n
+        # Where each slot's rate derivative lands in the Jacobian, so assembling it is one matrix product per step
+        self.slot_jacobian = np.zeros((len(self.reactions), slots, len(self.species), len(self.species)))
+        for j in range(len(self.reactions)):
+            for s in range(slots):
+                if self.slot_species[j, s] < len(self.species):
+                    self.slot_jacobian[j, s, :, self.slot_species[j, s]] = self.stoichiometry[j]
+        self.slot_jacobian = self.slot_jacobian.reshape(len(self.reactions) * slots, -1)
+        self.A = np.array([reaction[3] for reaction in self.reactions], dtype=float)
+        self.Ea = np.array([reaction[4] for reaction in self.reactions], dtype=float)
+        self.built = True
+
+    def equation(self, j):
+        name, reactants, products, A, Ea, orders = self.reactions[j]
+        side = lambda terms: " + ".join(f"{n} {species}" if n != 1 else species for species, n in terms.items())
+        return f"{side(reactants)} -> {side(products)}"
+
+    def concentrations(self, vessels, **amounts):
+        # Zeroed (vessels, species) array with the given species filled in, in mol/L
+        C = np.zeros((vessels, len(self.species)))
+        for species, amount in amounts.items():
+            C[:, self.species.index(species)] = amount
+        return C
+
+    def rate_constants(self, T):
+        # Arrhenius, one row per vessel
+        if not self.built:
+            self.build()
+        T = np.atleast_1d(np.asarray(T, dtype=float))
+        return self.A * np.exp(-self.Ea / (GAS_CONSTANT * T[:, None]))
+
+    def slot_concentrations(self, C):
+        return np.concatenate([C, np.ones((len(C), 1))], axis=1)[:, self.slot_species]
+
+    def derivative(self, C, k):
+        rates = k * np.prod(self.slot_concentrations(C) ** self.slot_orders, axis=2)
+        return rates @ self.stoichiometry
+
+    def jacobian(self, C, k):
+        base = self.slot_concentrations(C)
+        powers = base ** self.slot_orders
+        d_rates = np.empty_like(powers)
+        for s in range(self.slot_orders.shape[1]):
+            # Only a handful of slots, everything inside is vectorized over vessels and reactions
+            others = np.prod(np.delete(powers, s, axis=2), axis=2)
+            order = self.slot_orders[:, s]
+            d_rates[..., s] = k * order * np.maximum(base[..., s], 1e-30) ** (order - 1) * others
+        return (d_rates.reshape(len(C), -1) @ self.slot_jacobian).reshape(len(C), len(self.species), len(self.species))
+
+    def integrate(self, C, T, duration, h=None, rtol=1e-3, atol=1e-8, max_steps=10000):
+        # Adaptive ROS2 Rosenbrock steps, every vessel keeps its own step size and only unfinished vessels are stepped.
+        # Passing the same h array every frame carries the step sizes over instead of searching for them again.
+        # Raises RuntimeError when max_steps runs out before every vessel reached duration
+        C = np.array(C, dtype=float)
+        k = self.rate_constants(np.broadcast_to(T, len(C)))
+        t = np.zeros(len(C))
+        if h is None:
+            h = np.full(len(C), duration * 1e-3)
+        identity = np.eye(len(self.species))
+        for _ in range(max_steps):
+            active = np.flatnonzero(t < duration * (1 - 1e-12))
+            if not len(active):
+                break
+            y, ka = C[active], k[active]
+            base = h[active]
+            hh = np.minimum(base, duration - t[active])
+            # Both stages share W, so it is factored once per step
+            lu, pivots = lu_factor(identity - (ROS2_GAMMA * hh)[:, None, None] * self.jacobian(y, ka))
+            k1 = lu_solve(lu, pivots, self.derivative(y, ka))
+            # Negative intermediate concentrations would make fractional orders undefined
+            f1 = self.derivative(np.maximum(y + hh[:, None] * k1, 0.0), ka)
+            k2 = lu_solve(lu, pivots, f1 - 2 * k1)
+            y_new = y + hh[:, None] * (1.5 * k1 + 0.5 * k2)
+
+            # Difference to the embedded first order solution
+            scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_new))
+            err = np.max(np.abs(hh[:, None] * (0.5 * k1 + 0.5 * k2)) / scale, axis=1)
+            err = np.where(np.isfinite(err), err, np.inf)
+            accepted = err <= 1.0
+            rows = active[accepted]
+            C[rows] = np.maximum(y_new[accepted], 0.0)
+            t[rows] += hh[accepted]
+            # A step cut short to land on duration says nothing about the step size, so it never shrinks the next one
+            grown = hh * np.clip(0.9 / np.sqrt(np.maximum(err, 1e-10)), 0.2, 5.0)
+            h[active] = np.where(accepted & (hh < base), np.maximum(grown, base), grown)
+        else:
+            unfinished = np.count_nonzero(t < duration * (1 - 1e-12))
+            if unfinished:
+                raise RuntimeError(f"Reaction integration stopped after {max_steps} steps with {unfinished} vessels unfinished")
+        return C
+
+# name, reactants, products, pre-exponential factor, activation energy (J/mol), concentrations in mol/L
+REACTIONS = [
+    ("Hydrogen combustion", {"H2": 2, "O2": 1}, {"H2O": 2}, 1.0e11, 1.2e5),
+    ("Methane combustion", {"CH4": 1, "O2": 2}, {"CO2": 1, "H2O": 2}, 1.3e9, 2.0e5),
+    ("Hydrazine decomposition", {"N2H4": 1}, {"N2": 1, "H2": 2}, 3.0e9, 1.6e5),
+    ("Nitrogen dioxide dimerization", {"NO2": 2}, {"N2O4": 1}, 1.0e9, 0.0),
+    ("Dinitrogen tetroxide dissociation", {"N2O4": 1}, {"NO2": 2}, 1.0e16, 5.7e4),
+]
+
+def create_chemistry():
+    network = ReactionNetwork()
+    for name, reactants, products, A, Ea in REACTIONS:
+        network.add_reaction(name, reactants, products, A, Ea)
+    network.build()
+    return network
+
+# Genome bitfields: name, shift, width, trait range
+GENOME_FIELDS = [
+    ("metabolism", 0, 8, (0.02, 0.2)),  # energy burned per second
+    ("efficiency", 8, 8, (0.05, 0.5)),  # food eaten per second
+    ("threshold", 16, 8, (1.0, 4.0)),  # energy needed to divide
+    ("lifespan", 24, 8, (20.0, 200.0)),  # seconds
+    ("optimum", 32, 8, (150.0, 400.0)),  # preferred temperature in kelvin
+    ("mutation", 40, 8, (0.0, 0.02)),  # chance for each genome bit to flip on division
+    ("speed", 48, 8, (0.0, 2.0)),  # random walk distance per second
+]
+
+class Population:
+    def __init__(self, capacity=1024, size=(100.0, 100.0), grid=(64, 64), temperature=288.0, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.count = 0  # rows in use, dead rows below count are holes waiting to be reused
+        self.alive_count = 0
+        self.width, self.height = np.float32(size[0]), np.float32(size[1])
+        self.temperature = np.float32(temperature)
+        self.time = 0.0
+        self.genome = np.zeros(capacity, dtype=np.uint64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.energy = np.zeros(capacity, dtype=np.float32)
+        self.age = np.zeros(capacity, dtype=np.float32)
+        # Separate x and y columns, broadcasting against (n, 2) rows is several times slower
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        # Traits decoded from the genome once per birth, not every tick
+        self.traits = {name: np.zeros(capacity, dtype=np.float32) for name, shift, width, bounds in GENOME_FIELDS}
+        # Food on a coarse grid over the colony, organisms in the same cell compete for it
+        self.grid = grid
+        self.food_capacity = 1.0
+        self.food_regrowth = 0.05
+        self.food = np.full(grid[0] * grid[1], self.food_capacity, dtype=np.float32)
+
+    def columns(self):
+        return [self.genome, self.alive, self.energy, self.age, self.x, self.y, *self.traits.values()]
+
+    def grow(self, capacity):
+        for name in ["genome", "alive", "energy", "age", "x", "y"]:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        for name, old in self.traits.items():
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            self.traits[name] = new
+
+    def decode(self, rows):
+        for name, shift, width, (low, high) in GENOME_FIELDS:
+            bits = (self.genome[rows] >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+            self.traits[name][rows] = low + (high - low) * bits.astype(np.float32) / ((1 << width) - 1)
+
+    def add(self, genomes, x, y, energy):
+        # Fills dead rows first, then appends
+        genomes = np.atleast_1d(np.asarray(genomes, dtype=np.uint64))
+        holes = np.flatnonzero(~self.alive[:self.count])[:len(genomes)]
+        extra = len(genomes) - len(holes)
+        if self.count + extra > len(self.alive):
+            self.grow(max(len(self.alive) * 2, self.count + extra))
+        rows = np.concatenate([holes, np.arange(self.count, self.count + extra)])
+        self.count += extra
+        self.alive_count += len(rows)
+        self.genome[rows] = genomes
+        self.alive[rows] = True
+        self.energy[rows] = energy
+        self.age[rows] = 0
+        self.x[rows] = np.mod(x, self.width)
+        self.y[rows] = np.mod(y, self.height)
+        self.decode(rows)
+        return rows
+
+    def seed_colony(self, count, genome, center, spread=5.0, energy=1.0):
+        x = center[0] + self.rng.normal(0, spread, count)
+        y = center[1] + self.rng.normal(0, spread, count)
+        return self.add(np.full(count, genome, dtype=np.uint64), x, y, energy)
+
+    def mutate(self, genomes, rates):
+        # Every bit flips with its organism's own mutation rate
+        flips = self.rng.random((len(genomes), 64), dtype=np.float32) < rates[:, None]
+        masks = np.packbits(flips, axis=1, bitorder="little").view(np.uint64)[:, 0]
+        return genomes ^ masks
+
+    def cells(self, n):
+        column = (self.x[:n] * np.float32(self.grid[0] / self.width)).astype(np.int32)
+        row = (self.y[:n] * np.float32(self.grid[1] / self.height)).astype(np.int32)
+        return np.minimum(column, self.grid[0] - 1) * self.grid[1] + np.minimum(row, self.grid[1] - 1)
+
+    def step(self, dt):
+        n = self.count
+        dt = np.float32(dt)
+        alive = self.alive[:n]
+        traits = {name: values[:n] for name, values in self.traits.items()}
+
+        # Feeding, each cell splits its food between the organisms asking for it
+        cell = self.cells(n)
+        demand = traits["efficiency"] * dt * alive
+        total = np.bincount(cell, weights=demand, minlength=len(self.food)).astype(np.float32)
+        share = np.divide(self.food, total, out=np.ones_like(self.food), where=total > self.food)
+        eaten = demand * share[cell]
+        self.food -= np.bincount(cell, weights=eaten, minlength=len(self.food)).astype(np.float32)
+        np.minimum(self.food + self.food_regrowth * dt, self.food_capacity, out=self.food)
+
+        # Growth and selection, organisms far from their preferred temperature burn more energy
+        stress = 1 + np.abs(traits["optimum"] - self.temperature) / np.float32(50)
+        self.energy[:n] += eaten - traits["metabolism"] * stress * dt
+        self.age[:n] += dt
+
+        # Random walk from cheap int8 noise
+        reach = traits["speed"] * (dt / np.float32(127))
+        for axis, limit in ((self.x, self.width), (self.y, self.height)):
+            moved = axis[:n] + self.rng.integers(-127, 128, n, dtype=np.int8) * reach
+            axis[:n] = moved - np.floor(moved / limit) * limit
+
+        # Death
+        dead = alive & ((self.energy[:n] <= 0) | (self.age[:n] > traits["lifespan"]))
+        self.alive[:n] &= ~dead
+        self.alive_count -= int(np.count_nonzero(dead))
+
+        # Division, the parent's energy is split with a mutated child
+        parents = np.flatnonzero(self.alive[:n] & (self.energy[:n] >= traits["threshold"]))
+        if len(parents):
+            self.energy[parents] /= 2
+            children = self.mutate(self.genome[parents], self.traits["mutation"][parents])
+            x = self.x[parents] + self.rng.normal(0, 0.5, len(parents))
+            y = self.y[parents] + self.rng.normal(0, 0.5, len(parents))
+            self.add(children, x, y, self.energy[parents])
+
+        # Keep the live rows dense once too many holes pile up
+        if self.count - self.alive_count > max(1024, self.count // 4):
+            self.compact()
+        self.time += float(dt)
+
+    def compact(self):
+        rows = np.flatnonzero(self.alive[:self.count])
+        for values in self.columns():
+            values[:len(rows)] = values[rows]
+        self.alive[len(rows):self.count] = False
+        self.count = len(rows)
+
+    def mean_traits(self):
+        alive = self.alive[:self.count]
+        return {name: float(values[:self.count][alive].mean()) if self.alive_count else 0.0 for name, values in self.traits.items()}
+
+def bootstrap(size=(800, 600)):
+    # Only the subsystems the game uses, pygame.init() would also start audio and joysticks
+    global screen, clock, save_index, save_writer
+    startup.mark("import")
+    pygame.display.init()
+    pygame.font.init()
+    startup.mark("pygame init")
+
+    # Fonts resolve in the background while the window comes up
+    fonts.preload(PRELOAD_FONTS)
+    screen = pygame.display.set_mode(size, pygame.RESIZABLE)
+    pygame.display.set_caption("The Lab")
+    screen.fill((200, 200, 200))
+    pygame.display.flip()
+    clock = pygame.time.Clock()
+    startup.mark("window")
+
+    os.makedirs("saves", exist_ok=True)
+    save_index = SaveIndex()
+    save_writer = SaveWriter()
+    startup.mark("saves")
 
-    def is_clicked_once(self):
-        mouse_pos = pygame.mouse.get_pos()
-        mouse_pressed = pygame.mouse.get_pressed()
-        # If mouse is down on the button, set clicked to True
-        if self.rect.collidepoint(mouse_pos) and mouse_pressed[0]:
-            self.clicked = True
-        # If mouse is released and was previously clicked, return True once
-        elif self.clicked and not mouse_pressed[0]:
-            self.clicked = False
-            return True
-        return False
-    
-    def is_clicked(self):
-        mouse_pos = pygame.mouse.get_pos()
-        mouse_pressed = pygame.mouse.get_pressed()
-        if self.rect.collidepoint(mouse_pos) and mouse_pressed[0]:
-            return True
-        return False
-    
 def load_save(file_name):
     file_path = os.path.join("saves", file_name)
     if os.path.exists(file_path):
-        with open(file_path, 'r') as file:
-            data = json.load(file)
-        print(f"Loaded save file: {file_name}")
-        print(data)
+        try:
+            data = SaveData.open(file_path)
+        except (OSError, ValueError) as e:
+            print(f"Could not load save file {file_name}: {e}")
+            return None
+        if data.legacy:
+            print(f"Loaded legacy save file: {file_name}, it will be converted on the next save")
+        else:
+            print(f"Loaded save file: {file_name}")
         return data
     else:
         print(f"Save file {file_name} does not exist.")
         return None
+
+def wait_for_events(timeout=None):
+    # Block on the event queue while the scene is static instead of spinning at 60 FPS
+    if timeout is None:
+        event = pygame.event.wait()
+    else:
+        event = pygame.event.wait(max(int(timeout * 1000), 1))
+    events = [] if event.type == pygame.NOEVENT else [event]
+    return events + pygame.event.get()
+
+def resize_window(event, *roots):
+    # Widgets keep their state, only geometry is recomputed
+    global screen
+    screen = pygame.display.set_mode((event.w, event.h), pygame.RESIZABLE)
+    for root in roots:
+        root.layout(screen.get_rect())
+    return screen.get_size()
+
+def present(surface, draw_scene, widgets, full_redraw):
+    # Repaints the whole scene on full redraws, otherwise only the rects of widgets whose state changed
+    if full_redraw:
+        draw_scene()
+        pygame.display.flip()
+        return
+    rects = [widget.rect.copy() for widget in widgets if widget.needs_redraw()]
+    for rect in rects:
+        surface.set_clip(rect)
+        draw_scene()
+    surface.set_clip(None)
+    if rects:
+        pygame.display.update(rects)
     
 
 
@@ -249,7 +3255,7 @@ def about():
 
     offset_y = 0
     WIDTH, HEIGHT = screen.get_size()
-    font = pygame.font.SysFont("Monospace", 24, bold=True)
+    font = fonts.get("Monospace", 24, bold=True)
 
     eve = None
 
@@ -275,52 +3281,83 @@ def about():
     doc.add(DocumentObject("listobj", "A few examples of experiments you can try"))
     doc.add(DocumentObject("text", "  in the game."))
     doc.add(DocumentObject("newline", ""))
+    chemistry = create_chemistry()
+    doc.add(DocumentObject("h2", "Reactions"))
+    for j, reaction in enumerate(chemistry.reactions):
+        doc.add(DocumentObject("listobj", reaction[0]))
+        doc.add(DocumentObject("text", f"  {chemistry.equation(j)}"))
+    doc.add(DocumentObject("newline", ""))
+    doc.add(DocumentObject("h2", "Atmospheres"))
+    for name, pressure, temperature, molar_mass, gamma, top, layers in ATMOSPHERES:
+        doc.add(DocumentObject("listobj", f"{name}: {pressure / 1000:g} kPa, {temperature:g} K at the surface"))
+    doc.add(DocumentObject("newline", ""))
+    doc.add(DocumentObject("h2", "Organisms"))
+    doc.add(DocumentObject("text", "Traits encoded in every genome:"))
+    for name, shift, width, (low, high) in GENOME_FIELDS:
+        doc.add(DocumentObject("listobj", f"{name.capitalize()}: {low:g} to {high:g} (bits {shift}-{shift + width - 1})"))
+    doc.add(DocumentObject("newline", ""))
+    catalog = ExoplanetCatalog.open()
+    if catalog is not None and len(catalog):
+        doc.add(DocumentObject("h2", "Exoplanets"))
+        # Only the nearest ones, the rest of the catalog stays on disk
+        planets = catalog.nearest("distance", 100)
+        doc.add(DocumentObject("text", f"{len(catalog)} known planets, the nearest {len(planets)}:"))
+        for planet in planets:
+            name = planet["name"].decode("utf-8")
+            doc.add(DocumentObject("listobj", f"{name}: {planet['distance']:.1f} pc, {planet['mass']:.2f} Earth masses"))
+        doc.add(DocumentObject("newline", ""))
     doc.init()
 
     # Buttons
     exit_button = Button("Back", (10, 10), (60, 60))
     buttons = [exit_button]
 
-    # Surfaces
-    about_text = font.render("About The Lab", True, (50, 50, 50))
+    # Labels
+    about_label = Label(font.render("About The Lab", True, (50, 50, 50)))
 
-    # Rects
-    about_rect = about_text.get_rect(center=(WIDTH // 2, 24))
+    # Layout
+    root = UINode(stretch=(1, 1))
+    root.add(UINode(exit_button, offset=(10, 10)))
+    root.add(UINode(about_label, anchor=(0.5, 0), pivot=(0.5, 0.5), offset=(0, 24)))
+    root.layout(screen.get_rect())
+    dispatcher = EventDispatcher(buttons)
+
+    def draw_scene():
+        screen.fill((200, 200, 200))
+        doc.draw(screen, offset_y+100)
+        for widget in root.widgets():
+            widget.draw(screen)
     
+    full_redraw = True
     running = True
     while running:
-        for event in pygame.event.get():
+        present(screen, draw_scene, buttons, full_redraw)
+        full_redraw = False
+
+        for event in wait_for_events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.VIDEORESIZE:
                 is_resized = True
                 eve = event
+            elif event.type == pygame.WINDOWEXPOSED:
+                full_redraw = True
             elif event.type == pygame.MOUSEWHEEL:
                 offset_y += event.y * 5
+                offset_y = max(offset_y, min(0, HEIGHT - 100 - doc.height))
                 offset_y = min(offset_y, 0)
+                full_redraw = True
 
-        screen.fill((200, 200, 200))
-
-        doc.draw(screen, offset_y+100)
-
-        screen.blit(about_text, about_rect.topleft)
-
-        for button in buttons:
-            button.draw(screen)
-            if button.is_clicked_once():
-                if button.text == "Back":
-                    return
+            if dispatcher.dispatch(event) is exit_button:
+                return
                 
-        pygame.display.flip()
         clock.tick(60)
 
         if is_resized:
-            screen = pygame.display.set_mode((eve.w, eve.h), pygame.RESIZABLE)
-            WIDTH, HEIGHT = screen.get_size()
-            exit_button = Button("Back", (10, 10), (60, 60))
-            buttons = [exit_button]
-            about_rect = about_text.get_rect(center=(WIDTH // 2, 24))
+            WIDTH, HEIGHT = resize_window(eve, root)
+            dispatcher.rebuild(buttons)
+            full_redraw = True
             is_resized = False
 
 def create_new_menu():
@@ -329,83 +3366,81 @@ def create_new_menu():
     eve = None
 
     WIDTH, HEIGHT = screen.get_size()
-    font = pygame.font.SysFont("Monospace", 24, bold=True)
+    font = fonts.get("Monospace", 24, bold=True)
 
     # Buttons
-    x = WIDTH // 2
     exit_button = Button("Back", (10, 10), (60, 60))
-    create_button = Button("Create", (x, HEIGHT // 2 - 30), (200, 50))
-    rollseed_button = Button("Roll Seed", (x, HEIGHT // 2 + 30), (200, 50))
+    create_button = Button("Create", (0, 0), (200, 50))
+    rollseed_button = Button("Roll Seed", (0, 0), (200, 50))
     buttons = [exit_button, create_button, rollseed_button]
 
     # Input boxes
-    name_input = InputBox((x - 220, HEIGHT // 2 - 30), (200, 30), text_color=(0, 0, 0))
-    seed_input = InputBox((x - 220, HEIGHT // 2 + 30), (200, 30), text_color=(0, 0, 0), characters="0123456789")
+    name_input = InputBox((0, 0), (200, 30), text_color=(0, 0, 0))
+    seed_input = InputBox((0, 0), (200, 30), text_color=(0, 0, 0), characters="0123456789")
     inputs = [name_input, seed_input]
 
-    # Surfaces
-    subtitle_text = font.render("Create New Save", True, (50, 50, 50))
-    title_text = title_font.render("The Lab", True, (50, 50, 50))
-
-    # Rects
-    subtitle_rect = subtitle_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 50))
-    title_rect = title_text.get_rect(center=(WIDTH // 2, 150))
+    # Labels
+    subtitle_label = Label(font.render("Create New Save", True, (50, 50, 50)))
+    title_label = Label(fonts.get(*TITLE_FONT).render("The Lab", True, (50, 50, 50)))
+
+    # Layout
+    root = UINode(stretch=(1, 1))
+    root.add(UINode(title_label, anchor=(0.5, 0), pivot=(0.5, 0.5), offset=(0, 150)))
+    root.add(UINode(subtitle_label, anchor=(0.5, 0.5), pivot=(0.5, 0.5), offset=(0, -50)))
+    root.add(UINode(exit_button, offset=(10, 10)))
+    root.add(UINode(create_button, anchor=(0.5, 0.5), pivot=(0, 0), offset=(0, -30)))
+    root.add(UINode(rollseed_button, anchor=(0.5, 0.5), pivot=(0, 0), offset=(0, 30)))
+    root.add(UINode(name_input, anchor=(0.5, 0.5), pivot=(0, 0), offset=(-220, -30)))
+    root.add(UINode(seed_input, anchor=(0.5, 0.5), pivot=(0, 0), offset=(-220, 30)))
+    root.layout(screen.get_rect())
+    dispatcher = EventDispatcher(buttons + inputs)
+
+    def draw_scene():
+        screen.fill((200, 200, 200))
+        for widget in root.widgets():
+            widget.draw(screen)
 
+    full_redraw = True
     running = True
     while running:
         dt = clock.tick(60) / 1000  # Convert milliseconds to seconds
-        for event in pygame.event.get():
+        for input_box in inputs:
+            input_box.update(dt)
+
+        present(screen, draw_scene, buttons + inputs, full_redraw)
+        full_redraw = False
+
+        # Only wake up for the cursor blink when an input box is active
+        blinks = [input_box.next_blink() for input_box in inputs if input_box.active]
+        for event in wait_for_events(min(blinks) if blinks else None):
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.VIDEORESIZE:
                 is_resized = True
                 eve = event
-
-            for input_box in inputs:
-                input_box.handle_event(event)
-
-        screen.fill((200, 200, 200))
-
-        screen.blit(title_text, title_rect.topleft)
-        screen.blit(subtitle_text, subtitle_rect.topleft)
-
-        for button in buttons:
-            button.draw(screen)
-            if button.is_clicked_once():
-                if button.text == "Back":
-                    return "Main Menu"
-                elif button.text == "Create":
-                    name = name_input.text.strip()
-                    seed = seed_input.text.strip()
-                    with open(os.path.join("saves", f"{name}.tlab"), 'w') as file:
-                        data = {
-                            "seed": seed
-                        }
-                        json.dump(data, file)
-                    print(f"Created new save file: {name}.tlab with seed {seed}")
-                    return "Load Menu"
-                elif button.text == "Roll Seed":
-                    seed_input.text = str(random.randint(0, 9999999999))
-                
-        for input_box in inputs:
-            input_box.draw(screen, dt)
-                
-        pygame.display.flip()
-        clock.tick(60)
+            elif event.type == pygame.WINDOWEXPOSED:
+                full_redraw = True
+
+            clicked = dispatcher.dispatch(event)
+            if clicked is exit_button:
+                return "Main Menu"
+            elif clicked is create_button:
+                name = name_input.text.strip()
+                seed = seed_input.text.strip()
+                data = {
+                    "seed": seed
+                }
+                save_writer.save(f"{name}.tlab", data)
+                print(f"Created new save file: {name}.tlab with seed {seed}")
+                return "Load Menu"
+            elif clicked is rollseed_button:
+                seed_input.text = str(random.randint(0, 9999999999))
 
         if is_resized:
-            screen = pygame.display.set_mode((eve.w, eve.h), pygame.RESIZABLE)
-            WIDTH, HEIGHT = screen.get_size()
-            exit_button = Button("Back", (10, 10), (60, 60))
-            create_button = Button("Create", (WIDTH // 2, HEIGHT // 2 - 30), (200, 50))
-            rollseed_button = Button("Roll Seed", (WIDTH // 2, HEIGHT // 2 + 30), (200, 50))
-            buttons = [exit_button, create_button, rollseed_button]
-            name_input = InputBox((WIDTH // 2 - 220, HEIGHT // 2 - 30), (200, 30), text_color=(0, 0, 0))
-            seed_input = InputBox((WIDTH // 2 - 220, HEIGHT // 2 + 30), (200, 30), text_color=(0, 0, 0), characters="0123456789")
-            inputs = [name_input, seed_input]
-            subtitle_rect = subtitle_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 50))
-            title_rect = title_text.get_rect(center=(WIDTH // 2, 150))
+            WIDTH, HEIGHT = resize_window(eve, root)
+            dispatcher.rebuild(buttons + inputs)
+            full_redraw = True
             is_resized = False
 
 def load_menu() -> tuple[dict, str]:
@@ -413,91 +3448,217 @@ def load_menu() -> tuple[dict, str]:
 
     eve = None
     WIDTH, HEIGHT = screen.get_size()
-    font = pygame.font.SysFont("Monospace", 24, bold=True)
+    font = fonts.get("Monospace", 24, bold=True)
 
     # Save files
-    save_files = [f for f in os.listdir("saves") if f.endswith(".tlab")]
-    save_buttons = []
+    save_index.refresh()
+    save_list = SaveList(save_index, (0, 0, 0, 0))
 
     # Buttons
     exit_button = Button("Back", (10, 10), (60, 60))
     buttons = [exit_button]
 
-    # Surfaces
-    subtitle_text = font.render("Select Save", True, (50, 50, 50))
-    title_text = title_font.render("The Lab", True, (50, 50, 50))
-
-    # Rects
-    subtitle_rect = subtitle_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 50))
-    title_rect = title_text.get_rect(center=(WIDTH // 2, 150))
+    # Labels
+    subtitle_label = Label(font.render("Select Save", True, (50, 50, 50)))
+    title_label = Label(fonts.get(*TITLE_FONT).render("The Lab", True, (50, 50, 50)))
+    error_font = fonts.get("Monospace", 18)
+    error = None  # shown under the subtitle when a save failed to load
+
+    # Layout
+    root = UINode(stretch=(1, 1))
+    root.add(UINode(title_label, anchor=(0.5, 0), pivot=(0.5, 0.5), offset=(0, 150)))
+    root.add(UINode(subtitle_label, anchor=(0.5, 0.5), pivot=(0.5, 0.5), offset=(0, -50)))
+    root.add(UINode(save_list, size=(0, -10), anchor=(0, 0.5), pivot=(0, 0), stretch=(1, 0.5)))
+    root.add(UINode(exit_button, offset=(10, 10)))
+    root.layout(screen.get_rect())
+    dispatcher = EventDispatcher([save_list] + buttons)
+
+    def draw_scene():
+        screen.fill((200, 200, 200))
+        for widget in root.widgets():
+            widget.draw(screen)
+        if error:
+            surface = text_cache.render(error_font, error, (180, 30, 30))
+            screen.blit(surface, surface.get_rect(midtop=(subtitle_label.rect.centerx, subtitle_label.rect.bottom + 2)))
 
+    full_redraw = True
     running = True
     while running:
-        for event in pygame.event.get():
+        present(screen, draw_scene, buttons + [save_list], full_redraw)
+        full_redraw = False
+
+        for event in wait_for_events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.VIDEORESIZE:
                 is_resized = True
                 eve = event
-
-        for i, save_file in enumerate(save_files):
-            save_button = Button(save_file[:-5], (WIDTH // 2 - 100, HEIGHT // 2 + i * 40), (200, 30))
-            save_buttons.append(save_button)
-
-        screen.fill((200, 200, 200))
-
-        screen.blit(title_text, title_rect.topleft)
-        screen.blit(subtitle_text, subtitle_rect.topleft)
-
-        for button in save_buttons:
-            button.draw(screen)
-            if button.is_clicked_once():
-                return load_save(button.text + ".tlab"), button.text + ".tlab"
-
-        for button in buttons:
-            button.draw(screen)
-            if button.is_clicked_once():
-                if button.text == "Back":
-                    return None
+            elif event.type == pygame.WINDOWEXPOSED:
+                full_redraw = True
+            elif event.type == SAVE_EVENT and event.status == "saved":
+                # The directory mtime can miss a save that just finished, so the saved file is always re-read
+                save_index.refresh()
+                save_index.update(event.file_name)
+                save_list.clamp_scroll()
+                full_redraw = True
+
+            clicked = dispatcher.dispatch(event)
+            if clicked is exit_button:
+                return None
+            elif clicked is save_list and save_list.selected is not None:
+                name, save_list.selected = save_list.selected, None
+                save_data = load_save(name)
+                if save_data is not None:
+                    return save_data, name
+                # The save went bad since it was indexed, show it as unreadable and stay in the menu
+                save_index.update(name, force=True)
+                error = f"Could not load {name}"
+                full_redraw = True
                 
-        pygame.display.flip()
         clock.tick(60)
 
         if is_resized:
-            screen = pygame.display.set_mode((eve.w, eve.h), pygame.RESIZABLE)
-            WIDTH, HEIGHT = screen.get_size()
-            subtitle_rect = subtitle_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 50))
-            title_rect = title_text.get_rect(center=(WIDTH // 2, 150))
+            WIDTH, HEIGHT = resize_window(eve, root)
+            dispatcher.rebuild([save_list] + buttons)
+            full_redraw = True
             is_resized = False
 
-def play_game(save_data, save_file):
+def play_game(save_data, save_file, replay=None, seek=0.0, headless=False):
     global screen, is_resized
 
+    if save_data is None:
+        print(f"Save file {save_file} could not be loaded")
+        return
+
     eve = None
     WIDTH, HEIGHT = screen.get_size()
-    font = pygame.font.SysFont("Monospace", 24, bold=True)
+    font = fonts.get("Monospace", 24, bold=True)
 
     # Flags
     paused = False
 
+    # Physics
+    sim_clock = SimulationClock()
+    frame = 0
+    target_frame = 0
+    if replay is not None:
+        # A replay starts from the checkpoint before the seek target and simulates forward unseen until it gets there
+        target_frame = replay.frame_at(seek)
+        checkpoint = replay.checkpoint_before(target_frame)
+        frame, state, session = replay.checkpoint(checkpoint)
+        world = PhysicsWorld()
+        world.load_state(state, session["names"])
+        sim_clock.warp, sim_clock.accumulator = session["warp"], session["accumulator"]
+    elif "bodies" in save_data:
+        try:
+            world = PhysicsWorld.from_dict(save_data["bodies"])
+        except (ValueError, KeyError, TypeError, IndexError) as e:
+            print(f"Could not load the bodies in {save_file}: {e}")
+            save_data.close()
+            return
+    else:
+        world = create_solar_system()
+        create_asteroid_belt(world, seed=parse_seed(save_data.get("seed", "")))
+    world.atmospheres = create_atmospheres(world, os.path.join("data", "atmospheres"))
+    # A step back on a copy gives the first frames a state to blend from
+    back = world.copy()
+    back.step(-sim_clock.dt)
+    previous = back.pos[:back.count].copy()
+
+    # Universe, generated lazily around the player from the save seed
+    universe = Universe(parse_seed(save_data.get("seed", "")))
+    galactic_pos = np.zeros(3)
+    # Real exoplanets to land on, the nearest host is only looked up again once the player moved
+    catalog = ExoplanetCatalog.open()
+    landing_target = None
+    landing_checked_pos = None
+    predictor = PredictionService()
+    predicted_thrust = None
+    prediction_horizon = 6 * 3600
+    view_scale = 1e5  # meters per pixel, the mouse wheel zooms
+    renderer = CelestialRenderer()
+    colors = body_colors(world.names[:world.count])
+    focus = world.index("Earth") if "Earth" in world.names else 0  # Tab cycles the camera through the bodies
+
+    # --record logs every frame's input with periodic checkpoints, replays check the state against those checkpoints
+    recorder = None
+    if replay is not None:
+        paused, focus, view_scale = session["paused"], session["focus"], session["view_scale"]
+        start_frame = frame
+        next_check = checkpoint + 1
+        mismatches = []
+        replay_start = time.perf_counter()
+    elif "--record" in sys.argv:
+        recording = os.path.join("recordings", f"{os.path.splitext(save_file)[0]}-{time.strftime('%Y%m%d-%H%M%S')}.trec")
+        recorder = SessionRecorder(recording, {"seed": save_data.get("seed", ""), "save_file": save_file})
+
     # Buttons
-    resume_button = Button("Resume", (WIDTH // 2 - 100, HEIGHT // 2 - 50), (200, 50))
-    save_button = Button("Save", (WIDTH // 2 - 100, HEIGHT // 2 + 10), (200, 50))
-    about_button = Button("About", (WIDTH // 2 - 100, HEIGHT // 2 + 70), (200, 50))
-    quit_button = Button("Quit", (WIDTH // 2 - 100, HEIGHT // 2 + 130), (200, 50))
+    resume_button = Button("Resume", (0, 0), (200, 50))
+    save_button = Button("Save", (0, 0), (200, 50))
+    about_button = Button("About", (0, 0), (200, 50))
+    quit_button = Button("Quit", (0, 0), (200, 50))
     pause_buttons = [resume_button, save_button, about_button, quit_button]
 
-    # Surfaces
-    paused_text = font.render("Paused", True, (50, 50, 50))
+    # Labels
+    paused_label = Label(font.render("Paused", True, (50, 50, 50)))
+
+    # Layout
+    pause_menu = UINode(stretch=(1, 1))
+    pause_menu.add(UINode(paused_label, anchor=(0.5, 1 / 3), pivot=(0.5, 0.5)))
+    pause_column = pause_menu.add(UINode(anchor=(0.5, 0.5), pivot=(0.5, 0), offset=(0, -50), direction="column", spacing=10))
+    for button in pause_buttons:
+        pause_column.add(UINode(button, anchor=(0.5, 0)))
+    pause_menu.layout(screen.get_rect())
+    dispatcher = EventDispatcher(pause_buttons)
 
     # Rects
     fps_pos = (10, 10)
+    save_status_pos = (10, 40)
+    warp_pos = (10, 70)
+    landing_text_pos = (10, 100)
+    camera_text_pos = (10, 130)
+
+    save_status = f"Recording to {recorder.path}" if recorder is not None else ""
+    fps_text = LiveText(font)
+    frame_dt = 0
+
+    # F3 shows the frame profiler, F4 writes its history as a Chrome trace
+    profiler = FrameProfiler()
+    profile_font = fonts.get("Monospace", 16)
 
     running = True
     while running:
-        for event in pygame.event.get():
+        profiler.begin_frame()
+        if recorder is not None and recorder.checkpoint_due():
+            recorder.checkpoint(world.state(), {"names": world.names[:world.count], "warp": sim_clock.warp,
+                                                "accumulator": sim_clock.accumulator, "paused": paused, "focus": int(focus),
+                                                "view_scale": view_scale})
+        if replay is not None:
+            if next_check < len(replay.checkpoints) and replay.checkpoint_frames[next_check] == frame:
+                if pack_arrays(world.state())[1] != pack_arrays(replay.checkpoint(next_check)[1])[1]:
+                    mismatches.append(frame)
+                next_check += 1
+            if frame >= len(replay):
+                break
+            # The recorded quit only ended the session, closing the window ends the replay early with its report
+            frame_dt, events = replay.frame(frame)
+            events = [event for event in events if event.type != pygame.QUIT]
+            if any(event.type == pygame.QUIT for event in pygame.event.get()):
+                break
+        else:
+            events = pygame.event.get()
+            if recorder is not None:
+                recorder.frame(frame_dt, events)
+        frame += 1
+        drawing = not headless and frame > target_frame
+
+        for event in events:
             if event.type == pygame.QUIT:
+                if recorder is not None:
+                    recorder.close()
+                predictor.stop()
+                world.close()
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.VIDEORESIZE:
@@ -507,110 +3668,224 @@ def play_game(save_data, save_file):
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     paused = not paused
-
-        screen.fill((200, 200, 200))
-
-        if paused:
-            surf = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA); pygame.draw.rect(surf, (0, 0, 0, 127), (0, 0, WIDTH, HEIGHT)); screen.blit(surf, (0, 0))
-            screen.blit(paused_text, (WIDTH // 2 - paused_text.get_width() // 2, HEIGHT // 3 - paused_text.get_height() // 2))
-            for button in pause_buttons:
-                button.draw(screen)
-                if button.is_clicked_once():
-                    if button.text == "Resume":
-                        paused = False
-                    elif button.text == "Save":
-                        with open(os.path.join("saves", save_file), 'w') as file:
-                            json.dump(save_data, file)
-                    elif button.text == "About":
-                        about()
-                    elif button.text == "Quit":
-                        return 
-
-        screen.blit(font.render(f"FPS: {clock.get_fps():.2f}", True, (0, 0, 0)), fps_pos)
-
-        pygame.display.flip()
-        clock.tick(60)
+                elif event.key == pygame.K_PERIOD:
+                    sim_clock.change_warp(1)
+                elif event.key == pygame.K_COMMA:
+                    sim_clock.change_warp(-1)
+                elif event.key == pygame.K_TAB:
+                    # Tab skips the asteroids
+                    major = np.flatnonzero(~world.minor[:world.count])
+                    focus = int(major[np.searchsorted(major, focus, side="right") % len(major)])
+                elif event.key == pygame.K_F3:
+                    profiler.visible = not profiler.visible
+                elif event.key == pygame.K_F4:
+                    trace_file = os.path.join("traces", f"frame-trace-{time.strftime('%Y%m%d-%H%M%S')}.json")
+                    profiler.export_chrome_trace(trace_file)
+                    save_status = f"Trace written to {trace_file}"
+
+            elif event.type == pygame.MOUSEWHEEL and not paused:
+                view_scale = min(max(view_scale * 1.25 ** -event.y, 1.0), 1e13)
+
+            elif event.type == SAVE_EVENT and event.file_name == save_file:
+                if event.status == "saved" and not save_writer.is_saving(save_file):
+                    save_status = "Saved"
+                elif event.status == "failed":
+                    save_status = "Save failed"
+
+            clicked = dispatcher.dispatch(event) if paused else None
+            if clicked is resume_button:
+                paused = False
+            elif clicked is save_button and replay is None:
+                # Copying the columns is all the frame pays for, the writer thread builds the bodies section
+                save_writer.save(save_file, save_data, {"bodies": world.copy().to_dict})
+                save_status = "Saving..."
+            elif clicked is about_button and replay is None:
+                about()
+                # About may have resized the window
+                WIDTH, HEIGHT = screen.get_size()
+                pause_menu.layout(screen.get_rect())
+                dispatcher.rebuild(pause_buttons)
+            elif clicked is quit_button and replay is None:
+                if recorder is not None:
+                    recorder.close()
+                predictor.stop()
+                world.close()
+                save_data.close()
+                return
+        profiler.lap("events")
+
+        if not paused:
+            steps = sim_clock.update(frame_dt)
+            if steps:
+                # The state one step back is kept so frames between whole steps can be drawn in between
+                if steps > 1:
+                    world.step(sim_clock.dt, steps - 1)
+                previous = world.pos[:world.count].copy()
+                world.step(sim_clock.dt)
+            world.update_propagation()
+            remap = world.collide()
+            if remap is not None:
+                focus = max(remap[focus], 0)
+                colors = colors[remap >= 0]
+                previous = previous[remap >= 0]
+            universe.update(galactic_pos)
+            if catalog is not None and not np.array_equal(galactic_pos, landing_checked_pos):
+                landing_target = catalog.nearest_host(galactic_pos * LIGHT_YEAR / PARSEC)
+                landing_checked_pos = galactic_pos.copy()
+
+        # Trajectory prediction runs off-thread, the frame only asks again when thrust changed or the track went stale
+        vessels = np.flatnonzero(world.gm[:world.count] == 0)
+        if len(vessels):
+            vessel = vessels[0]
+            thrust = tuple(world.thrust[vessel])
+            if thrust != predicted_thrust or world.time - predictor.time > prediction_horizon / 4:
+                predictor.request(world, vessel, prediction_horizon)
+                predicted_thrust = thrust
+            predictor.poll()
+        profiler.lap("update")
+
+        if drawing:
+            screen.fill((200, 200, 200))
+
+            # Physics moves in whole steps, so the frame draws the last two states blended by the time left over
+            positions = world.pos[:world.count]
+            if len(previous) == world.count:
+                positions = previous + (positions - previous) * (sim_clock.accumulator / sim_clock.dt)
+            center = positions[focus]
+            renderer.draw(screen, positions, world.radius[:world.count], colors, center, view_scale)
+
+            if predictor.track is not None:
+                reference = max(world.parent[vessels[0]], 0) if len(vessels) else 0
+                offset = positions[reference] - center
+                points = (predictor.track[:, :2] + offset[:2]) / view_scale + (WIDTH // 2, HEIGHT // 2)
+                pygame.draw.lines(screen, (50, 50, 200), False, points.tolist(), 1)
+
+            if paused:
+                surf = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA); pygame.draw.rect(surf, (0, 0, 0, 127), (0, 0, WIDTH, HEIGHT)); screen.blit(surf, (0, 0))
+                for widget in pause_menu.widgets():
+                    widget.draw(screen)
+
+            screen.blit(fps_text.render(f"FPS: {clock.get_fps():.2f}"), fps_pos)
+            if save_status:
+                screen.blit(text_cache.render(font, save_status, (0, 0, 0)), save_status_pos)
+            screen.blit(text_cache.render(font, f"Warp: {sim_clock.warp}x", (0, 0, 0)), warp_pos)
+            if landing_target is not None and landing_target[0] is not None:
+                name, distance = landing_target
+                screen.blit(text_cache.render(font, f"Nearest exoplanet host: {name} ({distance * PARSEC / LIGHT_YEAR:.1f} ly)", (0, 0, 0)), landing_text_pos)
+            screen.blit(text_cache.render(font, f"{world.names[focus]}: {view_scale:.3g} m/px", (0, 0, 0)), camera_text_pos)
+            if profiler.visible:
+                profiler.draw(screen, (WIDTH - 310, 10), profile_font)
+            profiler.lap("draw")
+
+            pygame.display.flip()
+            profiler.lap("flip")
+            frame_dt = clock.tick(60) / 1000
+            profiler.lap("idle")
 
         if is_resized:
-            screen = pygame.display.set_mode((eve.w, eve.h), pygame.RESIZABLE)
-            WIDTH, HEIGHT = screen.get_size()
-            resume_button = Button("Resume", (WIDTH // 2 - 100, HEIGHT // 2 - 50), (200, 50))
-            save_button = Button("Save", (WIDTH // 2 - 100, HEIGHT // 2 + 10), (200, 50))
-            about_button = Button("About", (WIDTH // 2 - 100, HEIGHT // 2 + 70), (200, 50))
-            quit_button = Button("Quit", (WIDTH // 2 - 100, HEIGHT // 2 + 130), (200, 50))
-            pause_buttons = [resume_button, save_button, about_button, quit_button]
+            WIDTH, HEIGHT = resize_window(eve, pause_menu)
+            dispatcher.rebuild(pause_buttons)
             is_resized = False
 
+    # Only replays leave the loop, at the end of the log or when the window is closed
+    played = replay.times[frame] - replay.times[start_frame]
+    print(f"Replayed {frame - start_frame} frames ({played:.1f} s of play) in {time.perf_counter() - replay_start:.2f} s, "
+          f"{len(mismatches)} checkpoint mismatches" + (f", first at frame {mismatches[0]}" if mismatches else ""))
+    predictor.stop()
+    world.close()
+    save_data.close()
+    return mismatches
+
 def main_menu():
     global screen, is_resized
 
     eve = None
     WIDTH, HEIGHT = screen.get_size()
-    font = pygame.font.SysFont("Monospace", 24, bold=True)
+    font = fonts.get("Monospace", 24, bold=True)
 
     # Buttons
-    load_button = Button("Load", (WIDTH // 2 - 100, HEIGHT // 2 - 50), (200, 50))
-    new_button = Button("New", (WIDTH // 2 - 100, HEIGHT // 2 + 10), (200, 50))
-    about_button = Button("About", (WIDTH // 2 - 100, HEIGHT // 2 + 70), (200, 50))
-    quit_button = Button("Quit", (WIDTH // 2 - 100, HEIGHT // 2 + 130), (200, 50))
+    load_button = Button("Load", (0, 0), (200, 50))
+    new_button = Button("New", (0, 0), (200, 50))
+    about_button = Button("About", (0, 0), (200, 50))
+    quit_button = Button("Quit", (0, 0), (200, 50))
     buttons = [load_button, new_button, about_button, quit_button]
 
-    # Surfaces
-    title_text = title_font.render("The Lab", True, (50, 50, 50))
+    # Labels
+    title_label = Label(fonts.get(*TITLE_FONT).render("The Lab", True, (50, 50, 50)))
 
-    # Rects
-    title_rect = title_text.get_rect(center=(WIDTH // 2, 150))
+    # Layout
+    root = UINode(stretch=(1, 1))
+    root.add(UINode(title_label, anchor=(0.5, 0), pivot=(0.5, 0.5), offset=(0, 150)))
+    button_column = root.add(UINode(anchor=(0.5, 0.5), pivot=(0.5, 0), offset=(0, -50), direction="column", spacing=10))
+    for button in buttons:
+        button_column.add(UINode(button, anchor=(0.5, 0)))
+    root.layout(screen.get_rect())
+    dispatcher = EventDispatcher(buttons)
 
+    def draw_scene():
+        screen.fill((200, 200, 200))
+        for widget in root.widgets():
+            widget.draw(screen)
+
+    full_redraw = True
     running = True
     while running:
-        for event in pygame.event.get():
+        present(screen, draw_scene, buttons, full_redraw)
+        full_redraw = False
+        startup.finish("main menu")
+
+        for event in wait_for_events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.VIDEORESIZE:
                 is_resized = True
                 eve = event
-
-        screen.fill((200, 200, 200))
-
-        screen.blit(title_text, title_rect.topleft)
-
-        for button in buttons:
-            button.draw(screen)
-            if button.is_clicked_once():
-                if button.text == "Load":
+            elif event.type == pygame.WINDOWEXPOSED:
+                full_redraw = True
+
+            clicked = dispatcher.dispatch(event)
+            if clicked is load_button:
+                save_data = load_menu()
+                if save_data is not None:
+                    return save_data
+            elif clicked is new_button:
+                scene = create_new_menu()
+                if scene == "Load Menu":
                     save_data = load_menu()
                     if save_data is not None:
                         return save_data
-                elif button.text == "New":
-                    scene = create_new_menu()
-                    if scene == "Load Menu":
-                        save_data = load_menu()
-                        if save_data is not None:
-                            return save_data
-                    elif scene == "Main Menu":
-                        continue
-                elif button.text == "About":
-                    about()
-                elif button.text == "Quit":
-                    pygame.quit()
-                    sys.exit()
+            elif clicked is about_button:
+                about()
+            elif clicked is quit_button:
+                pygame.quit()
+                sys.exit()
+
+            if clicked is not None:
+                # Sub-scenes draw over the whole window and may resize it
+                root.layout(screen.get_rect())
+                dispatcher.rebuild(buttons)
+                full_redraw = True
 
-        pygame.display.flip()
         clock.tick(60)
 
         if is_resized:
-            screen = pygame.display.set_mode((eve.w, eve.h), pygame.RESIZABLE)
-            WIDTH, HEIGHT = screen.get_size()
-            load_button = Button("Load", (WIDTH // 2 - 100, HEIGHT // 2 - 50), (200, 50))
-            new_button = Button("New", (WIDTH // 2 - 100, HEIGHT // 2 + 10), (200, 50))
-            about_button = Button("About", (WIDTH // 2 - 100, HEIGHT // 2 + 70), (200, 50))
-            quit_button = Button("Quit", (WIDTH // 2 - 100, HEIGHT // 2 + 130), (200, 50))
-            buttons = [load_button, new_button, about_button, quit_button]
-            title_rect = title_text.get_rect(center=(WIDTH // 2, 150))
+            WIDTH, HEIGHT = resize_window(eve, root)
+            dispatcher.rebuild(buttons)
+            full_redraw = True
             is_resized = False
 
 def main():
+    # python "The Lab.py" --replay recordings/<file>.trec [--seek seconds] [--headless]
+    headless = "--headless" in sys.argv
+    if headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+    bootstrap()
+    if "--replay" in sys.argv:
+        replay = SessionReplay(sys.argv[sys.argv.index("--replay") + 1])
+        seek = float(sys.argv[sys.argv.index("--seek") + 1]) if "--seek" in sys.argv else 0.0
+        mismatches = play_game(SaveData({"seed": replay.meta["seed"]}), replay.meta["save_file"], replay, seek, headless)
+        sys.exit(1 if mismatches else 0)
     while True:
         save_data, save_file = main_menu()
         play_game(save_data, save_file)
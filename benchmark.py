@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import importlib.util
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+import numpy as np
+
+GAME_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "The Lab.py")
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class BenchClock:
+    # Stands in for pygame's clock so frames are timed without the 60 FPS sleep
+    def __init__(self):
+        self.last = time.perf_counter()
+        self.fps = 0.0
+
+    def tick(self, framerate=0):
+        now = time.perf_counter()
+        dt = now - self.last
+        self.last = now
+        self.fps = 1 / dt if dt > 0 else 0.0
+        return dt * 1000
+
+    def get_fps(self):
+        return self.fps
+
+class ScriptedInput:
+    # Hands the scene one scripted batch of events per poll and times the gap between polls
+    def __init__(self, frames):
+        self.frames = iter(frames)
+        self.pointer = (0, 0)
+        self.times = []
+        self.first = None
+        self.last = None
+
+    def poll(self, *args, **kwargs):
+        now = time.perf_counter()
+        if self.last is not None:
+            self.times.append(now - self.last)
+        else:
+            self.first = now
+        self.last = now
+        events = next(self.frames, None)
+        if events is None:
+            events = [pygame.event.Event(pygame.QUIT)]
+        for event in events:
+            if hasattr(event, "pos"):
+                self.pointer = event.pos
+        return events
+
+def motion(pos):
+    return pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(0, 0, 0), touch=False)
+
+def wheel(y):
+    return pygame.event.Event(pygame.MOUSEWHEEL, x=0, y=y, flipped=False, precise_x=0.0, precise_y=float(y), touch=False, which=0)
+
+def resize(w, h):
+    return pygame.event.Event(pygame.VIDEORESIZE, w=w, h=h, size=(w, h))
+
+def key(k, unicode=""):
+    return pygame.event.Event(pygame.KEYDOWN, key=k, unicode=unicode, mod=0, scancode=0)
+
+def click(pos):
+    return [pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=pos, touch=False),
+            pygame.event.Event(pygame.MOUSEBUTTONUP, button=1, pos=pos, touch=False)]
+
+def resize_storm(count):
+    sizes = [(640, 480), (800, 600), (1024, 768), (1280, 960), (700, 900)]
+    return [[resize(*sizes[i % len(sizes)])] for i in range(count)]
+
+def hover_sweep(count, x, top, bottom):
+    return [[motion((x, top + (bottom - top) * (i % 50) // 50))] for i in range(count)]
+
+# Scenarios: name -> (setup, scene, frames), setup runs inside the game's working directory
+def main_menu_hover(lab):
+    return lambda: None, lab.main_menu, hover_sweep(600, 400, 250, 500)
+
+def main_menu_resize(lab):
+    return lambda: None, lab.main_menu, resize_storm(120)
+
+def about_scroll(lab):
+    frames = [[motion((400, 300))]] + [[wheel(-1)] for _ in range(300)] + [[wheel(1)] for _ in range(300)]
+    return lambda: None, lab.about, frames
+
+def about_resize(lab):
+    return lambda: None, lab.about, resize_storm(120)
+
+def load_menu_saves(lab):
+    def setup():
+        for i in range(500):
+            with open(os.path.join("saves", f"save {i:03}.tlab"), 'wb') as file:
+                lab.write_save_file(file, {"seed": str(i)})
+    frames = [[motion((400, 400))]]
+    frames += [[wheel(-1)] for _ in range(300)] + [[wheel(1)] for _ in range(300)]
+    frames += hover_sweep(300, 400, 310, 580)
+    return setup, lab.load_menu, frames
+
+def create_new_menu_typing(lab):
+    frames = [click((300, 285))]
+    for i in range(200):
+        frames.append([key(pygame.K_a + i % 26, chr(ord("a") + i % 26))])
+        if i % 20 == 19:
+            frames += [[key(pygame.K_BACKSPACE)] for _ in range(10)]
+    frames += resize_storm(40)
+    return lambda: None, lab.create_new_menu, frames
+
+def play_game_running(lab):
+    frames = [[key(pygame.K_PERIOD, ".")] for _ in range(3)] + [[] for _ in range(600)]
+    return lambda: None, lambda: lab.play_game(lab.SaveData({"seed": "1"}), "benchmark.tlab"), frames
+
+def play_game_paused(lab):
+    # A long pause menu session, hovering across the buttons without clicking them
+    frames = [[key(pygame.K_ESCAPE)]]
+    for _ in range(3):
+        frames += hover_sweep(200, 400, 250, 480)
+        frames += resize_storm(20)
+    frames += [[key(pygame.K_ESCAPE)]] + [[] for _ in range(60)]
+    return lambda: None, lambda: lab.play_game(lab.SaveData({"seed": "1"}), "benchmark.tlab"), frames
+
+SCENARIOS = {
+    "main_menu_hover": main_menu_hover,
+    "main_menu_resize": main_menu_resize,
+    "about_scroll": about_scroll,
+    "about_resize": about_resize,
+    "load_menu_500_saves": load_menu_saves,
+    "create_new_menu_typing": create_new_menu_typing,
+    "play_game_running": play_game_running,
+    "play_game_paused": play_game_paused,
+}
+
+def load_game():
+    spec = importlib.util.spec_from_file_location("the_lab", GAME_PATH)
+    lab = importlib.util.module_from_spec(spec)
+    sys.modules["the_lab"] = lab
+    spec.loader.exec_module(lab)
+    return lab
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def run_scenario(name, mode):
+    # Runs inside a child process, in a scratch directory so saves/ starts empty
+    os.chdir(tempfile.mkdtemp(prefix="lab-bench-"))
+    lab = load_game()
+    lab.bootstrap()
+    setup, scene, frames = SCENARIOS[name](lab)
+    setup()
+
+    scripted = ScriptedInput(frames)
+    lab.clock = BenchClock()
+    lab.wait_for_events = scripted.poll
+    pygame.event.get = scripted.poll
+    pygame.mouse.get_pos = lambda: scripted.pointer
+    pygame.mouse.get_focused = lambda: True
+    # Scenes quit with pygame.quit() and sys.exit(), keep pygame alive until the results are written
+    pygame.quit = lambda: None
+
+    if mode == "alloc":
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        scene()
+    except SystemExit:
+        pass
+    elapsed = time.perf_counter() - start
+
+    if mode == "alloc":
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"alloc_net_kb": round((current - baseline) / 1024, 1), "alloc_peak_kb": round((peak - baseline) / 1024, 1)}
+
+    # Setup runs from the scene call to its first poll, every gap between two polls is a frame
+    times = np.array(scripted.times) * 1000
+    if not len(times):
+        times = np.zeros(1)
+    return {
+        "frames": len(scripted.times),
+        "setup_ms": round((scripted.first - start) * 1000, 3) if scripted.first is not None else None,
+        "total_s": round(elapsed, 3),
+        "mean_ms": round(float(times.mean()), 3),
+        "p50_ms": round(float(np.percentile(times, 50)), 3),
+        "p95_ms": round(float(np.percentile(times, 95)), 3),
+        "p99_ms": round(float(np.percentile(times, 99)), 3),
+        "max_ms": round(float(times.max()), 3),
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+def run_child(name, mode, timeout):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--scenario", name, "--mode", mode],
+                            capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit code {result.returncode}"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(GAME_PATH)).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baseline, tolerance):
+    # Regressions are judged on tail frame time and on memory that is still held when the scene exits
+    regressions = []
+    for name, current in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old or "error" in current or "error" in old:
+            continue
+        for metric in ("p95_ms", "p99_ms", "alloc_net_kb"):
+            if metric in current and metric in old and old[metric] > 0 and current[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {old[metric]} -> {current[metric]}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless frame time benchmarks for The Lab")
+    parser.add_argument("--scenarios", help="comma separated scenario names, all by default")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown before failing")
+    parser.add_argument("--no-alloc", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--list", action="store_true", help="list scenarios and exit")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", default="time", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(run_scenario(args.scenario, args.mode)))
+        return 0
+    if args.list:
+        print("\n".join(SCENARIOS))
+        return 0
+
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "scenarios": {},
+    }
+    for name in names:
+        # Every pass gets a fresh process, so scenarios never share caches or peak RSS
+        scenario = run_child(name, "time", args.timeout)
+        if not args.no_alloc and "error" not in scenario:
+            scenario.update(run_child(name, "alloc", args.timeout))
+        results["scenarios"][name] = scenario
+        print(f"{name}: {scenario}", file=sys.stderr)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+GAME_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "The Lab.py")
+
+def load_game():
+    # The game is a single script with a space in its name, so it is loaded by path like benchmark.py does
+    if "the_lab" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("the_lab", GAME_PATH)
+        lab = importlib.util.module_from_spec(spec)
+        sys.modules["the_lab"] = lab
+        spec.loader.exec_module(lab)
+    return sys.modules["the_lab"]
+
+@pytest.fixture
+def lab():
+    return load_game()
@@ -0,0 +1,81 @@
+import numpy as np
+
+def direct(positions, gm, targets, softening, skip=None):
+    d = positions[None, :, :] - targets[:, None, :]
+    r2 = np.einsum("ijk,ijk->ij", d, d) + softening ** 2
+    if skip is not None:
+        r2[np.arange(len(targets)), skip] = np.inf
+    return np.einsum("ij,ijk->ik", gm * r2 ** -1.5, d)
+
+def belt(count, seed=0):
+    # Clustered like a real belt, so the tree has both dense and empty regions
+    rng = np.random.default_rng(seed)
+    angle = rng.uniform(0, 2 * np.pi, count)
+    radius = rng.uniform(3e11, 5e11, count)
+    positions = np.stack([radius * np.cos(angle), radius * np.sin(angle), rng.normal(0, 1e10, count)], axis=1)
+    return positions, rng.uniform(1e6, 1e9, count)
+
+def relative_errors(lab, positions, gm, theta, softening=1e6):
+    exact = direct(positions, gm, positions, softening, skip=np.arange(len(gm)))
+    tree = lab.GravityTree(positions, gm, theta=theta, softening=softening)
+    return np.linalg.norm(tree.self_accelerations() - exact, axis=1) / np.linalg.norm(exact, axis=1)
+
+def test_tree_matches_direct_sum(lab):
+    error = relative_errors(lab, *belt(3000), theta=0.3)
+    assert np.median(error) < 2e-3
+    assert error.max() < 2e-2
+
+def test_tree_error_shrinks_with_theta(lab):
+    positions, gm = belt(3000)
+    medians = [np.median(relative_errors(lab, positions, gm, theta)) for theta in (0.7, 0.5, 0.3)]
+    assert medians[0] > medians[1] > medians[2]
+    assert medians[0] < 2e-2
+
+def test_tree_pull_on_outside_points(lab):
+    positions, gm = belt(2000, seed=1)
+    points = np.random.default_rng(2).uniform(-6e11, 6e11, (50, 3))
+    tree = lab.GravityTree(positions, gm, theta=0.3)
+    exact = direct(positions, gm, points, 0.0)
+    error = np.linalg.norm(tree.accelerations(points) - exact, axis=1) / np.linalg.norm(exact, axis=1)
+    assert error.max() < 1e-2
+
+def test_tree_opens_every_node_without_theta(lab):
+    positions, gm = belt(500, seed=3)
+    tree = lab.GravityTree(positions, gm, theta=0.0, leaf_size=4, softening=1e6)
+    exact = direct(positions, gm, positions, 1e6, skip=np.arange(len(gm)))
+    assert np.allclose(tree.self_accelerations(), exact, rtol=1e-9)
+
+def brute_force_pairs(positions, radii):
+    i, j = np.triu_indices(len(radii), 1)
+    d = np.linalg.norm(positions[i] - positions[j], axis=1)
+    touching = d < radii[i] + radii[j]
+    return set(zip(i[touching].tolist(), j[touching].tolist()))
+
+def test_spatial_hash_pairs_match_brute_force(lab):
+    rng = np.random.default_rng(4)
+    positions = rng.uniform(-50, 50, (2000, 3))
+    radii = rng.uniform(0.2, 2.0, 2000)
+    grid = lab.SpatialHash(2 * radii.max())
+    grid.build(positions)
+    pairs = grid.pairs(radii)
+    assert len(pairs) > 0
+    assert set(map(tuple, pairs.tolist())) == brute_force_pairs(positions, radii)
+
+def test_spatial_hash_ignores_cells_that_share_a_wrapped_key(lab):
+    # Cells 2^21 apart hash to the same key, but the bodies in them are nowhere near each other
+    cell_size = 1.0
+    positions = np.array([[0.5, 0.5, 0.5], [0.5 + (1 << 21), 0.5, 0.5], [1.2, 0.5, 0.5]])
+    radii = np.full(3, 0.5)
+    grid = lab.SpatialHash(cell_size)
+    grid.build(positions)
+    assert grid.pairs(radii).tolist() == [[0, 2]]
+    assert grid.query(positions[1], 0.9).tolist() == [1]
+
+def test_spatial_hash_query_matches_brute_force(lab):
+    rng = np.random.default_rng(5)
+    positions = rng.uniform(-100, 100, (3000, 3))
+    grid = lab.SpatialHash(4.0)
+    grid.build(positions)
+    for point, radius in zip(rng.uniform(-100, 100, (20, 3)), rng.uniform(1, 30, 20)):
+        expected = np.flatnonzero(np.linalg.norm(positions - point, axis=1) <= radius)
+        assert grid.query(point, radius).tolist() == expected.tolist()
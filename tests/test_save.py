@@ -0,0 +1,82 @@
+import json
+
+import numpy as np
+import pytest
+
+def write(lab, path, sections):
+    with open(path, "wb") as file:
+        lab.write_save_file(file, sections)
+
+def test_sections_round_trip_and_load_lazily(lab, tmp_path):
+    path = tmp_path / "game.tlab"
+    sections = {"seed": "42", "settings": {"volume": 0.5}, "bodies": {"time": 1.0, "bodies": [{"name": "Sun"}]}}
+    write(lab, path, sections)
+    with lab.SaveData.open(str(path)) as data:
+        assert not data.legacy
+        assert sorted(data) == sorted(sections)
+        assert data.loaded == {}
+        assert data["settings"] == sections["settings"]
+        assert list(data.loaded) == ["settings"]
+        assert dict(data) == sections
+
+def test_untouched_sections_are_copied_through(lab, tmp_path):
+    write(lab, tmp_path / "a.tlab", {"seed": "1", "bodies": list(range(1000))})
+    with lab.SaveData.open(str(tmp_path / "a.tlab")) as data:
+        data["seed"] = "2"
+        write(lab, tmp_path / "b.tlab", data.snapshot())
+    with lab.SaveData.open(str(tmp_path / "b.tlab")) as data:
+        assert data["seed"] == "2"
+        assert data["bodies"] == list(range(1000))
+
+def test_corrupted_section_is_reported(lab, tmp_path):
+    path = tmp_path / "bad.tlab"
+    write(lab, path, {"seed": "1", "notes": "x" * 1000})
+    raw = bytearray(path.read_bytes())
+    raw[lab.SAVE_HEADER.size + 4] ^= 0xFF
+    path.write_bytes(bytes(raw))
+    with lab.SaveData.open(str(path)) as data:
+        with pytest.raises(ValueError):
+            data["seed"]
+    path.write_bytes(bytes(raw[:lab.SAVE_HEADER.size]))
+    with pytest.raises(ValueError):
+        lab.SaveData.open(str(path))
+
+def test_legacy_json_save(lab, tmp_path):
+    path = tmp_path / "old.tlab"
+    path.write_text(json.dumps({"seed": "7"}))
+    with lab.SaveData.open(str(path)) as data:
+        assert data.legacy
+        assert data["seed"] == "7"
+
+def test_world_to_dict_round_trip(lab):
+    world = lab.create_solar_system()
+    lab.create_asteroid_belt(world, count=200, seed=3)
+    earth = world.index("Earth")
+    world.add_body("Probe", 0.0, world.pos[earth] + (7e6, 0, 0), world.vel[earth] + (0, 7500, 0), earth, 1.0, 2.0)
+    world.step(60.0, 10)
+    # Through JSON, the way the bodies section is stored
+    restored = lab.PhysicsWorld.from_dict(json.loads(json.dumps(world.to_dict())))
+    n = world.count
+    assert restored.count == n and restored.names == world.names[:n]
+    assert restored.time == world.time
+    for column in ("mass", "radius", "drag_area", "minor", "parent", "rails", "pos", "vel"):
+        assert np.array_equal(getattr(restored, column)[:n], getattr(world, column)[:n]), column
+    # Rails restart from the saved state, so stepping on only agrees to rounding
+    for w in (world, restored):
+        w.step(60.0, 10)
+    scale = np.linalg.norm(world.pos[:n] - world.pos[world.index("Sun")], axis=1).max()
+    assert np.abs(restored.pos[:n] - world.pos[:n]).max() < 1e-12 * scale
+
+def test_save_writer_builds_deferred_sections(lab, tmp_path):
+    writer = lab.SaveWriter(str(tmp_path), backups=1)
+    world = lab.create_solar_system()
+    data = lab.SaveData({"seed": "5"})
+    writer.save("game.tlab", data, {"bodies": world.copy().to_dict})
+    writer.save("game.tlab", data, {"bodies": world.copy().to_dict})
+    writer.close()
+    assert data.loaded == {"seed": "5"}
+    with lab.SaveData.open(str(tmp_path / "game.tlab")) as saved:
+        assert saved["seed"] == "5"
+        assert lab.PhysicsWorld.from_dict(saved["bodies"]).names == world.names[:world.count]
+    # The second save kept the first one as a backup
+    assert (tmp_path / "game.tlab.1").exists()
@@ -0,0 +1,37 @@
+import numpy as np
+
+def rocket(lab):
+    vessel = lab.Vessel()
+    core = vessel.add_part("Capsule", 1000.0, (0, 0, 2))
+    vessel.add_part("Tank", 500.0, (0, 0, 0), core, fuel=2000.0, decouple_stage=0)
+    vessel.add_part("Engine", 300.0, (0, 0, -1), 1, thrust=(0, 0, 50000.0), isp=300.0)
+    return vessel
+
+def test_add_part_to_drained_group(lab):
+    vessel = rocket(lab)
+    while vessel.burn(10.0).any():
+        pass
+    assert vessel.level[1] == 0
+    assert np.isclose(vessel.mass, 1800.0)
+
+    vessel.add_part("Spare tank", 200.0, (0, 0, 1), 1, fuel=400.0)
+    mass, moment, second = vessel.moments()
+    assert np.isfinite(moment).all() and np.isfinite(second).all() and np.isfinite(vessel.inertia).all()
+    assert np.isclose(mass, 1800.0 + 200.0 + 400.0)
+    assert np.isclose(vessel.group_fuel[1] * vessel.level[1], 400.0)
+
+    # The new fuel burns like any other
+    thrust = vessel.burn(1.0)
+    assert thrust[2] > 0
+    assert vessel.mass < 2400.0
+
+def test_add_part_to_partly_drained_group(lab):
+    vessel = rocket(lab)
+    vessel.burn(20.0)
+    before = vessel.mass
+    vessel.add_part("Spare tank", 200.0, (0, 0, 1), 1, fuel=400.0)
+    assert np.isclose(vessel.mass, before + 600.0)
+    # Dropping the stage takes every part of the group, new tank included
+    debris = vessel.stage()
+    assert np.isclose(vessel.mass, 1000.0)
+    assert np.isclose(sum(part.mass for part in debris), before + 600.0 - 1000.0)